@@ -1,145 +1,124 @@
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response
 from flask import session
-import joblib
 import pandas as pd
 from datetime import datetime
-import sqlite3
-from werkzeug.utils import secure_filename
 import os
-import matplotlib.pyplot as plt
+import math
+import threading
+from bisect import bisect_left, insort
+from charts import pyplot, save_chart, cached_charts, data_version
+import valuation
+from migrations import migrate, has_table
+import db
+import metrics
+import history
+import comparables
+import images
+from db import get_db
+from batcher import MicroBatcher
+from valuation import (
+    predict_prices, cached_price, price_recommendation, deal_class, risk_label, anomaly_flags,
+    LRUCache, claim_rescore, refresh_valuations, cached_valuations,
+    score_listing, store_valuations, is_current, valuate, listing_row
+)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "database.db")
 
 app = Flask(__name__)
-UPLOAD_FOLDER = os.path.join(BASE_DIR, "static", "uploads")
+db.init_app(app)
+metrics.init_app(app)
+UPLOAD_FOLDER = images.UPLOAD_DIR
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# {% set img = image_variant(p.image, 480) %} -> resized jpg/webp once images.py has made them
+app.jinja_env.globals["image_variant"] = images.variant
+
+# Bring the schema and stored valuations up to date with the deployed model
+_conn = db.connect()
+migrate(_conn)
+refresh_valuations(_conn)
+HAS_LOCATION_FTS = has_table(_conn, "properties_fts")
+_conn.close()
+
+# Filtered counts and the location list for the home page; cleared whenever listings change.
+# The TTL bounds staleness for writes made by other worker processes.
+listing_cache = LRUCache(maxsize=1024, ttl=60)
+
+# Single-listing valuations from concurrent requests are coalesced into one predict call
+scorer = MicroBatcher(predict_prices, lookup=cached_price)
+
+
+def invalidate_listing_cache():
+    listing_cache.clear()
+
+
+@valuation.on_model_swap
+def rescore_swapped(cities):
+    # stored scores (SQL sorts, rating filters, dashboard stats) still come from the old
+    # model; rescore those cities' rows in the background rather than lazily page by page.
+    # Every gunicorn worker sees the swap, so only the one that claims it does the work;
+    # the others keep scoring stale rows lazily (cached_valuations) until it's done.
+    def run():
+        conn = db.connect()
+        try:
+            if not claim_rescore(conn):
+                return
+            n = refresh_valuations(conn, cities=cities)
+        finally:
+            conn.close()
+        invalidate_listing_cache()
+        print(f"✅ Rescored {n} listings after model swap ({', '.join(sorted(cities))})")
+    threading.Thread(target=run, name="rescore-swap", daemon=True).start()
+
+
+# sort -> (key column, direction); every ordering ends in id so (key, id) is a unique cursor
+SORT_KEYS = {
+    "new": (None, "DESC"),
+    "price_asc": ("listed_price", "ASC"),
+    "price_desc": ("listed_price", "DESC"),
+    # served by idx_properties_score, so "best deals first" never scores the whole table
+    "score": ("investment_score", "DESC"),
+}
+
+
+# Sorted (lowercase, name) pairs for prefix lookups; model vocabulary plus anything in the DB
+def build_location_index():
+    names = set(valuation.all_locations())
+    conn = db.connect()
+    names.update(r[0] for r in conn.execute("SELECT DISTINCT location FROM properties"))
+    conn.close()
+    return sorted((n.lower(), n) for n in names if n)
 
-# Load model
-model = joblib.load("model/pune_house_price_model.pkl")
-columns = joblib.load("model/model_columns.pkl")
 
-def predict_price(location, sqft, bath, bhk):
-    x = pd.DataFrame(columns=columns)
-    x.loc[0] = 0
-    
-    x.loc[0, 'total_sqft'] = sqft
-    x.loc[0, 'bath'] = bath
-    x.loc[0, 'bhk'] = bhk
-    
-    loc_col = "site_location_" + location
-    if loc_col in columns:
-        x.loc[0, loc_col] = 1
-    
-    return model.predict(x)[0]
+location_index = build_location_index()
+
+
+def add_to_location_index(name):
+    entry = (name.lower(), name)
+    i = bisect_left(location_index, entry)
+    if i == len(location_index) or location_index[i] != entry:
+        insort(location_index, entry)
+
+
+def locations_with_prefix(prefix, limit=10):
+    prefix = prefix.lower()
+    out = []
+    i = bisect_left(location_index, (prefix, ""))
+    while i < len(location_index) and len(out) < limit and location_index[i][0].startswith(prefix):
+        out.append(location_index[i][1])
+        i += 1
+    return out
+
+
+def make_cursor(row, key):
+    return f"{row[key]}_{row['id']}" if key else str(row["id"])
+
+
+def parse_cursor(value, key):
+    if key:
+        k, pid = value.rsplit("_", 1)
+        return [float(k), int(pid)]
+    return [int(value)]
 
-def price_recommendation(listed_price, predicted_price):
-    difference = listed_price - predicted_price
-    percentage_diff = (difference / predicted_price) * 100
-    
-    if percentage_diff < -10:
-        return "Underpriced"
-    elif percentage_diff > 10:
-        return "Overpriced"
-    else:
-        return "Fairly Priced"
-
-def investment_score(listed_price, predicted_price):
-    listed_price = float(listed_price)
-    predicted_price = float(predicted_price)
-    if predicted_price <= 0:
-        return 50
-    diff_ratio = (predicted_price - listed_price) / predicted_price  # +ve means underpriced
-    score = 50 + (diff_ratio * 200)  # 10% underpriced => +20
-    if score < 0:
-        score = 0
-    if score > 100:
-        score = 100
-    return int(round(score))
-
-def deal_rating(listed_price, predicted_price):
-    listed_price = float(listed_price)
-    predicted_price = float(predicted_price)
-    if predicted_price <= 0:
-        return "Fair"
-    ratio = listed_price / predicted_price
-    if ratio <= 0.90:
-        return "Excellent"
-    if ratio <= 0.97:
-        return "Good"
-    if ratio <= 1.10:
-        return "Fair"
-    return "Overpriced"
-
-def deal_class(rating):
-    return {
-        "Excellent": "deal-excellent",
-        "Good": "deal-good",
-        "Fair": "deal-fair",
-        "Overpriced": "deal-overpriced"
-    }.get(rating, "deal-fair")
-
-def clamp(x, lo, hi):
-    return max(lo, min(hi, x))
-
-def risk_meter(listed_price, predicted_price, sqft, bhk, bath):
-    listed_price = float(listed_price)
-    predicted_price = float(predicted_price) if float(predicted_price) > 0 else listed_price
-    sqft = float(sqft)
-    bhk = int(bhk)
-    bath = int(bath)
-
-    ratio = listed_price / predicted_price if predicted_price > 0 else 1.0
-    risk = 0
-
-    if ratio > 1.20:
-        risk += 45
-    elif ratio > 1.10:
-        risk += 30
-    elif ratio < 0.85:
-        risk += 18
-
-    if sqft <= 0:
-        risk += 20
-    else:
-        sqft_per_bhk = sqft / max(1, bhk)
-        if sqft_per_bhk < 300:
-            risk += 20
-        elif sqft_per_bhk < 400:
-            risk += 12
-
-    if bath > bhk + 2:
-        risk += 12
-
-    return int(clamp(risk, 0, 100))
-
-def risk_label(risk):
-    if risk <= 20:
-        return ("Low", "risk-low")
-    if risk <= 50:
-        return ("Medium", "risk-med")
-    return ("High", "risk-high")
-
-def anomaly_flags(listed_price, predicted_price, sqft, bhk, bath):
-    listed_price = float(listed_price)
-    predicted_price = float(predicted_price) if float(predicted_price) > 0 else listed_price
-    sqft = float(sqft)
-    bhk = int(bhk)
-    bath = int(bath)
-
-    flags = []
-    ratio = listed_price / predicted_price if predicted_price > 0 else 1.0
-
-    if ratio > 1.25:
-        flags.append("Significantly above AI fair value")
-    if ratio < 0.80:
-        flags.append("Unusually below AI fair value")
-    if sqft > 0 and (sqft / max(1, bhk)) < 300:
-        flags.append("Low area per bedroom")
-    if bath > bhk + 2:
-        flags.append("Unusual bath count vs BHK")
-
-    return flags[:3]
 
 @app.route("/", methods=["GET", "POST"])
 def home():
@@ -153,12 +132,11 @@ def home():
         bhk = int(request.form["bhk"])
         listed_price = float(request.form["listed_price"])
 
-        predicted_price = predict_price(location, sqft, bath, bhk)
+        predicted_price = scorer.predict((location, sqft, bath, bhk))
         result = round(predicted_price, 2)
         recommendation = price_recommendation(listed_price, predicted_price)
 
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cursor = conn.cursor()
 
     q = request.args.get("q", "").strip()
@@ -166,7 +144,12 @@ def home():
     q_bhk = request.args.get("bhk", "").strip()
     min_price = request.args.get("min_price", "").strip()
     max_price = request.args.get("max_price", "").strip()
+    q_rating = request.args.get("rating", "").strip()
     sort_by = request.args.get("sort", "new")
+    if sort_by not in SORT_KEYS:
+        sort_by = "new"
+    after = request.args.get("after", "").strip()
+    before = request.args.get("before", "").strip()
     page = int(request.args.get("page", 1))
     per_page = 9
     offset = (page - 1) * per_page
@@ -175,7 +158,11 @@ def home():
     params = []
 
     if q:
-        sql += " AND location LIKE ?"
+        if HAS_LOCATION_FTS:
+            # trigram index answers the substring match without scanning properties
+            sql += " AND id IN (SELECT rowid FROM properties_fts WHERE location LIKE ?)"
+        else:
+            sql += " AND location LIKE ?"
         params.append(f"%{q}%")
 
     if q_location:
@@ -194,70 +181,88 @@ def home():
         sql += " AND listed_price <= ?"
         params.append(float(max_price))
 
-    count_sql = "SELECT COUNT(*) FROM (" + sql + ")"
-    cursor.execute(count_sql, params)
-    total = cursor.fetchone()[0]
+    if q_rating:
+        sql += " AND deal_rating = ?"
+        params.append(q_rating)
+
+    count_key = ("count", sql, tuple(params))
+    total = listing_cache.get(count_key)
+    if total is None:
+        cursor.execute("SELECT COUNT(*) FROM (" + sql + ")", params)
+        total = cursor.fetchone()[0]
+        listing_cache.set(count_key, total)
     total_pages = max(1, (total + per_page - 1) // per_page)
 
-    if sort_by == "price_asc":
-        sql += " ORDER BY listed_price ASC"
-    elif sort_by == "price_desc":
-        sql += " ORDER BY listed_price DESC"
+    # Keyset pagination: seek past the (key, id) of the edge row instead of OFFSET-ing
+    key, direction = SORT_KEYS[sort_by]
+    order_cols = [key, "id"] if key else ["id"]
+    backwards = bool(before) and not after
+    cursor_value = before if backwards else after
+    try:
+        seek = parse_cursor(cursor_value, key) if cursor_value else None
+    except ValueError:
+        # hand-edited or stale-format cursor: just show the first page
+        seek = None
+        cursor_value = ""
+        backwards = False
+
+    if cursor_value:
+        seek_desc = (direction == "DESC") != backwards
+        cols = "(" + ", ".join(order_cols) + ")"
+        marks = "(" + ", ".join("?" for _ in order_cols) + ")"
+        sql += f" AND {cols} {'<' if seek_desc else '>'} {marks}"
+        params += seek
+
+    if backwards:
+        direction = "ASC" if direction == "DESC" else "DESC"
+    sql += " ORDER BY " + ", ".join(f"{c} {direction}" for c in order_cols)
+
+    if cursor_value:
+        sql += " LIMIT ?"
+        params.append(per_page)
     else:
-        sql += " ORDER BY id DESC"
-
-    sql += " LIMIT ? OFFSET ?"
-    params2 = params + [per_page, offset]
-
-    cursor.execute(sql, params2)
-    db_properties = cursor.fetchall()
-
-    analyzed_properties = []
-    for p in db_properties:
-        predicted_price = predict_price(p["location"], p["sqft"], p["bath"], p["bhk"])
-        rec = price_recommendation(p["listed_price"], predicted_price)
-        rating = deal_rating(p["listed_price"], predicted_price)
-        score = investment_score(p["listed_price"], predicted_price)
-        dclass = deal_class(rating)
-        low = round(predicted_price * 0.92, 2)
-        high = round(predicted_price * 1.08, 2)
-
-        analyzed_properties.append({
-            "id": p["id"],
-            "location": p["location"],
-            "sqft": p["sqft"],
-            "bath": p["bath"],
-            "bhk": p["bhk"],
-            "listed_price": p["listed_price"],
-            "image": p["image"],
-            "predicted_price": round(predicted_price, 2),
-            "recommendation": rec,
-            "deal_rating": rating,
-            "deal_class": dclass,
-            "investment_score": score,
-            "fair_low": low,
-            "fair_high": high
-        })
-
-    cursor.execute("SELECT DISTINCT location FROM properties ORDER BY location")
-    locations = [r["location"] for r in cursor.fetchall()]
-
-    conn.close()
+        # plain ?page=N links still work, just without the seek
+        sql += " LIMIT ? OFFSET ?"
+        params += [per_page, offset]
+
+    # rows come back as compact Listing records, used by the template as-is
+    listings = conn.cursor()
+    listings.row_factory = listing_row
+    listings.execute(sql, params)
+    db_properties = listings.fetchall()
+    if backwards:
+        db_properties.reverse()
+
+    prev_cursor = make_cursor(db_properties[0], key) if db_properties else ""
+    next_cursor = make_cursor(db_properties[-1], key) if db_properties else ""
+
+    valuations = cached_valuations(conn, db_properties)
+    for p, v in zip(db_properties, valuations):
+        p.predicted_price, p.deal_rating, p.investment_score, p.risk_score = v
+
+    locations = listing_cache.get("locations")
+    if locations is None:
+        cursor.execute("SELECT DISTINCT location FROM properties ORDER BY location")
+        locations = [r["location"] for r in cursor.fetchall()]
+        listing_cache.set("locations", locations)
 
     return render_template(
         "home.html",
         result=result,
         recommendation=recommendation,
-        properties=analyzed_properties,
+        properties=db_properties,
         locations=locations,
         q=q,
         q_location=q_location,
         q_bhk=q_bhk,
         min_price=min_price,
         max_price=max_price,
+        q_rating=q_rating,
         sort_by=sort_by,
         page=page,
-        total_pages=total_pages
+        total_pages=total_pages,
+        prev_cursor=prev_cursor,
+        next_cursor=next_cursor
     )
 
 
@@ -266,14 +271,12 @@ def home():
 def property(pid):
     success = None
 
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cur = conn.cursor()
 
     cur.execute("SELECT * FROM properties WHERE id = ?", (pid,))
     p = cur.fetchone()
     if p is None:
-        conn.close()
         return "Property not found", 404
 
     if request.method == "POST":
@@ -288,36 +291,28 @@ def property(pid):
         conn.commit()
         success = "Inquiry sent successfully!"
 
-    cur.execute("""
-        SELECT old_price, new_price, changed_at
-        FROM price_history
-        WHERE property_id = ?
-        ORDER BY id ASC
-    """, (pid,))
-    hist = cur.fetchall()
-
-    labels = []
-    series = []
+    # optional ?from=&to= window; the series is downsampled to history.HISTORY_MAX_POINTS
+    try:
+        start = history.parse_date(request.args.get("from"))
+        end = history.parse_date(request.args.get("to"), end_of_day=True)
+    except ValueError:
+        start = end = None
+    points = history.price_points(conn, pid, start, end)
 
-    if not hist:
+    if not points:
         labels = ["Current"]
         series = [float(p["listed_price"])]
     else:
-        labels.append("Initial")
-        series.append(float(hist[0]["old_price"]))
-        for h in hist:
-            labels.append(h["changed_at"])
-            series.append(float(h["new_price"]))
+        labels = ["Initial"] + [history.format_ts(ts) for ts, _ in points[1:]]
+        series = [float(price) for _, price in points]
 
-    predicted_price = predict_price(p["location"], p["sqft"], p["bath"], p["bhk"])
+    predicted_price, rating, score, risk = cached_valuations(conn, [p])[0]
     rec = price_recommendation(p["listed_price"], predicted_price)
 
-    rating = deal_rating(p["listed_price"], predicted_price)
-    score = investment_score(p["listed_price"], predicted_price)
     dclass = deal_class(rating)
-    risk = risk_meter(p["listed_price"], predicted_price, p["sqft"], p["bhk"], p["bath"])
     risk_text, risk_class = risk_label(risk)
     flags = anomaly_flags(p["listed_price"], predicted_price, p["sqft"], p["bhk"], p["bath"])
+    comps = comparables.similar(conn, p)
 
     property_data = {
         "id": p["id"],
@@ -338,113 +333,96 @@ def property(pid):
         "flags": flags
     }
 
-    conn.close()
-
-    return render_template("property.html", p=property_data, success=success, labels=labels, series=series)
+    return render_template("property.html", p=property_data, success=success, labels=labels, series=series,
+                           comps=comps)
     
 
-@app.route("/dashboard")
-def dashboard():
-    charts_dir = os.path.join(BASE_DIR, "static", "charts")
-    os.makedirs(charts_dir, exist_ok=True)
-
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-
-    cur.execute("SELECT * FROM properties")
-    rows = cur.fetchall()
-    conn.close()
-
-    if not rows:
-        return "No properties found in database", 404
-
-    data = []
-    for r in rows:
-        pred = predict_price(r["location"], r["sqft"], r["bath"], r["bhk"])
-        rec = price_recommendation(r["listed_price"], pred)
-        data.append({
-            "location": r["location"],
-            "bhk": r["bhk"],
-            "listed_price": float(r["listed_price"]),
-            "recommendation": rec
-        })
-
-    df_dash = pd.DataFrame(data)
+def build_dashboard(conn):
+    # Reads the running aggregates in location_stats / bhk_stats (migrations.m006_summary_stats),
+    # so this is O(#locations) rather than a pass over every property
+    loc_rows = conn.execute("""
+        SELECT location, price_sum / listing_count AS avg_price
+        FROM location_stats WHERE listing_count > 0
+        ORDER BY avg_price DESC LIMIT 10
+    """).fetchall()
+    bhk_rows = conn.execute("""
+        SELECT bhk, price_sum / listing_count AS avg_price
+        FROM bhk_stats WHERE listing_count > 0 ORDER BY bhk
+    """).fetchall()
+    totals = conn.execute("""
+        SELECT SUM(listing_count), SUM(under), SUM(fair), SUM(over) FROM location_stats
+    """).fetchone()
+
+    plt = pyplot()
 
     # 1) Top 10 locations by avg listed price
-    loc_avg = df_dash.groupby("location")["listed_price"].mean().sort_values(ascending=False).head(10)
+    loc_avg = pd.Series({r["location"]: r["avg_price"] for r in loc_rows}, dtype=float)
     plt.figure()
     loc_avg.sort_values().plot(kind="barh")
     plt.xlabel("Avg Listed Price (Lakhs)")
     plt.ylabel("Location")
     plt.title("Top 10 Locations by Avg Listed Price")
-    chart1 = os.path.join(charts_dir, "loc_avg.png")
-    plt.tight_layout()
-    plt.savefig(chart1)
-    plt.close()
+    chart1 = save_chart("loc_avg")
 
     # 2) BHK vs avg listed price
-    bhk_avg = df_dash.groupby("bhk")["listed_price"].mean().sort_index()
+    bhk_avg = pd.Series({r["bhk"]: r["avg_price"] for r in bhk_rows}, dtype=float)
     plt.figure()
     bhk_avg.plot(kind="bar")
     plt.xlabel("BHK")
     plt.ylabel("Avg Listed Price (Lakhs)")
     plt.title("BHK vs Avg Listed Price")
-    chart2 = os.path.join(charts_dir, "bhk_avg.png")
-    plt.tight_layout()
-    plt.savefig(chart2)
-    plt.close()
+    chart2 = save_chart("bhk_avg")
 
     # 3) Recommendation counts
-    rec_counts = df_dash["recommendation"].value_counts()
+    rec_counts = pd.Series({"Underpriced": totals[1], "Fairly Priced": totals[2], "Overpriced": totals[3]})
+    rec_counts = rec_counts[rec_counts > 0].sort_values(ascending=False)
     plt.figure()
     rec_counts.plot(kind="bar")
     plt.xlabel("Recommendation")
     plt.ylabel("Count")
     plt.title("AI Recommendation Distribution")
-    chart3 = os.path.join(charts_dir, "rec_counts.png")
-    plt.tight_layout()
-    plt.savefig(chart3)
-    plt.close()
+    chart3 = save_chart("rec_counts")
+
+    return {
+        "charts": {"loc_avg": chart1, "bhk_avg": chart2, "rec_counts": chart3},
+        "total": int(totals[0] or 0),
+        "under": int(rec_counts.get("Underpriced", 0)),
+        "fair": int(rec_counts.get("Fairly Priced", 0)),
+        "over": int(rec_counts.get("Overpriced", 0))
+    }
+
+@app.route("/dashboard")
+def dashboard():
+    conn = get_db()
 
-    # cache-buster so browser updates images
-    ver = str(int(__import__("time").time()))
+    if conn.execute("SELECT 1 FROM properties LIMIT 1").fetchone() is None:
+        return "No properties found in database", 404
+
+    # charts and counts are only rebuilt when listings or the model change
+    ver = data_version(conn)
+    models = "|".join(f"{c}:{v}" for c, v in sorted(valuation.model_versions().items()))
+    dash = cached_charts("dashboard", (ver, models), lambda: build_dashboard(conn))
 
     return render_template(
         "dashboard.html",
         ver=ver,
-        total=len(df_dash),
-        under=int(rec_counts.get("Underpriced", 0)),
-        fair=int(rec_counts.get("Fairly Priced", 0)),
-        over=int(rec_counts.get("Overpriced", 0))
+        charts=dash["charts"],
+        total=dash["total"],
+        under=dash["under"],
+        fair=dash["fair"],
+        over=dash["over"]
     )
 
-@app.route("/analytics")
-def analytics():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-
-    cur.execute("SELECT location, listed_price FROM properties")
-    rows = cur.fetchall()
-    conn.close()
-
-    if not rows:
-        return "No data available"
-
-    import pandas as pd
-    import matplotlib.pyplot as plt
-    import os
-
-    df = pd.DataFrame(rows, columns=["location", "price"])
+def build_analytics(conn):
+    plt = pyplot()
 
-    # Create folder for charts
-    charts_dir = os.path.join(BASE_DIR, "static", "charts")
-    os.makedirs(charts_dir, exist_ok=True)
-
-    # 1️⃣ Average Price by Location
-    avg_price = df.groupby("location")["price"].mean().sort_values(ascending=False).head(10)
+    # 1️⃣ Average Price by Location (running aggregates, O(#locations))
+    rows = conn.execute("""
+        SELECT location, price_sum / listing_count AS avg_price
+        FROM location_stats WHERE listing_count > 0
+        ORDER BY avg_price DESC LIMIT 10
+    """).fetchall()
+    avg_price = pd.Series({r["location"]: r["avg_price"] for r in rows}, dtype=float)
 
     plt.figure(figsize=(10,6))
     avg_price.plot(kind="bar")
@@ -452,25 +430,30 @@ def analytics():
     plt.xlabel("Location")
     plt.ylabel("Average Price (Lakhs)")
     plt.xticks(rotation=45)
-
-    chart_path = os.path.join(charts_dir, "location_price.png")
-    plt.tight_layout()
-    plt.savefig(chart_path)
-    plt.close()
+    chart_path = save_chart("location_price")
 
     # 2️⃣ Price Distribution Graph
+    # the distribution still needs every price, but only the one indexed column
+    prices = pd.Series([r[0] for r in conn.execute("SELECT listed_price FROM properties")], dtype=float)
     plt.figure(figsize=(8,5))
-    df["price"].hist(bins=15)
+    prices.hist(bins=15)
     plt.title("Property Price Distribution")
     plt.xlabel("Price (Lakhs)")
     plt.ylabel("Number of Properties")
+    hist_path = save_chart("price_distribution")
+
+    return {"charts": {"location_price": chart_path, "price_distribution": hist_path}}
+
+@app.route("/analytics")
+def analytics():
+    conn = get_db()
+
+    if conn.execute("SELECT 1 FROM properties LIMIT 1").fetchone() is None:
+        return "No data available"
 
-    hist_path = os.path.join(charts_dir, "price_distribution.png")
-    plt.tight_layout()
-    plt.savefig(hist_path)
-    plt.close()
+    result = cached_charts("analytics", (data_version(conn),), lambda: build_analytics(conn))
 
-    return render_template("analytics.html")
+    return render_template("analytics.html", charts=result["charts"])
 
 @app.route("/add", methods=["GET", "POST"])
 def add_property():
@@ -482,44 +465,235 @@ def add_property():
         bath = int(request.form["bath"])
         bhk = int(request.form["bhk"])
         listed_price = float(request.form["listed_price"])
+        city = request.form.get("city") or valuation.DEFAULT_CITY
 
         image_file = request.files.get("image")
         filename = None
 
         if image_file and image_file.filename:
-            filename = secure_filename(image_file.filename)
-            image_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-            image_file.save(image_path)
+            # stored under its content hash; thumbnails are made in the background
+            filename = images.store_upload(image_file)
 
-        conn = sqlite3.connect(DB_PATH)
+        predicted_price = scorer.predict((location, sqft, bath, bhk, city))
+        pred, rating, score, risk = score_listing(listed_price, predicted_price, sqft, bath, bhk)
+
+        conn = get_db()
         cur = conn.cursor()
         cur.execute("""
-            INSERT INTO properties (location, sqft, bath, bhk, listed_price, image)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (location, sqft, bath, bhk, listed_price, filename))
+            INSERT INTO properties (location, sqft, bath, bhk, listed_price, image, city,
+                                    predicted_price, deal_rating, investment_score, risk_score, model_version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (location, sqft, bath, bhk, listed_price, filename, city,
+              pred, rating, score, risk, valuation.model_version(city)))
         conn.commit()
-        conn.close()
+        invalidate_listing_cache()
+        add_to_location_index(location)
+        comparables.add(cur.lastrowid, city, location, sqft, bath, bhk, listed_price)
 
         msg = "✅ Property posted successfully!"
 
-    # ✅ Get locations from model columns first
-    locations = sorted([c.replace("site_location_", "") for c in columns if c.startswith("site_location_")])
+    # ✅ Model location vocabulary, sorted once when the model is loaded
+    locations = valuation.all_locations()
 
     # ✅ Fallback: if for any reason model columns are empty, use DB distinct locations
     if not locations:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_db()
         cur = conn.cursor()
         cur.execute("SELECT DISTINCT location FROM properties ORDER BY location")
         locations = [r["location"] for r in cur.fetchall()]
-        conn.close()
 
-    return render_template("add.html", msg=msg, locations=locations)
+    # cities with a model of their own; anything else would just be scored as the default city
+    cities = sorted(valuation.model_versions())
+    return render_template("add.html", msg=msg, locations=locations, cities=cities,
+                           default_city=valuation.DEFAULT_CITY)
+
+@app.route("/api/locations")
+def location_suggestions():
+    q = request.args.get("q", "").strip()
+    if not q:
+        return jsonify([])
+    return jsonify(locations_with_prefix(q))
+
+# ---- JSON valuation API ----
+
+API_MAX_BATCH = int(os.environ.get("API_MAX_BATCH", 5000))
+
+
+# sanity caps for API input; far above any real listing, low enough to stay in int64/float range
+LISTING_MAX = {"sqft": 1e6, "bath": 50, "bhk": 50, "listed_price": 1e6}
+
+
+def parse_listing(d):
+    # JSON object -> (location, sqft, bath, bhk, listed_price, city); ValueError names the bad field
+    if not isinstance(d, dict):
+        raise ValueError("each listing must be a JSON object")
+    out = []
+    for field, cast in [("location", str), ("sqft", float), ("bath", int), ("bhk", int), ("listed_price", float)]:
+        if d.get(field) in (None, ""):
+            raise ValueError(f"missing field: {field}")
+        try:
+            out.append(cast(d[field]))
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid {field}: {d[field]!r}")
+    # float() takes "nan"/"inf"/"1e308": they'd score as garbage and serialize as invalid JSON
+    for i, field in ((1, "sqft"), (4, "listed_price")):
+        if not (math.isfinite(out[i]) and 0 < out[i] <= LISTING_MAX[field]):
+            raise ValueError(f"{field} must be a positive number up to {LISTING_MAX[field]:g}")
+    for i, field, low in ((2, "bath", 0), (3, "bhk", 1)):
+        if not low <= out[i] <= LISTING_MAX[field]:
+            raise ValueError(f"{field} must be between {low} and {LISTING_MAX[field]}")
+    # optional; routes the listing to that city's model
+    out.append(str(d.get("city") or valuation.DEFAULT_CITY))
+    return tuple(out)
+
+
+@app.route("/api/v1/valuate", methods=["POST"])
+def api_valuate():
+    try:
+        listing = parse_listing(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(valuate([listing], [scorer.predict(listing[:4] + listing[5:])])[0])
+
+@app.route("/api/v1/valuate/batch", methods=["POST"])
+def api_valuate_batch():
+    body = request.get_json(silent=True)
+    items = body.get("listings") if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        return jsonify({"error": "expected a JSON list of listings or {\"listings\": [...]}"}), 400
+    if len(items) > API_MAX_BATCH:
+        return jsonify({"error": f"batch too large: {len(items)} > {API_MAX_BATCH}"}), 413
+
+    listings = []
+    for i, d in enumerate(items):
+        try:
+            listings.append(parse_listing(d))
+        except ValueError as e:
+            return jsonify({"error": f"listings[{i}]: {e}"}), 400
+
+    # one model call for the whole batch
+    return jsonify({"count": len(listings), "results": valuate(listings)})
+
+@app.route("/api/v1/stats")
+def api_stats():
+    return jsonify({
+        "caches": valuation.cache_stats(),
+        "scorer": scorer.stats(),
+        "comparables": comparables.stats(),
+        "images": images.stats(),
+    })
+
+@app.route("/metrics")
+def prometheus_metrics():
+    gauges = []
+    # a metric family's samples have to be contiguous, so field first, then cache
+    caches = valuation.cache_stats()
+    for field in ("size", "hits", "misses"):
+        for name, st in caches.items():
+            gauges.append((f"valuestate_cache_{field}", {"cache": name}, st[field]))
+    for field, value in scorer.stats().items():
+        gauges.append((f"valuestate_scorer_{field}", {}, value))
+    for field, value in comparables.stats().items():
+        gauges.append((f"valuestate_comparables_{field}", {}, value))
+    for field, value in images.stats().items():
+        gauges.append((f"valuestate_images_{field}", {}, value))
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/v1/properties/<int:pid>/history")
+def api_price_history(pid):
+    method = request.args.get("method", "lttb")
+    if method not in history.METHODS:
+        return jsonify({"error": f"method must be one of {', '.join(history.METHODS)}"}), 400
+    try:
+        start = history.parse_date(request.args.get("from"))
+        end = history.parse_date(request.args.get("to"), end_of_day=True)
+        points = int(request.args.get("points", history.HISTORY_MAX_POINTS))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    points = max(3, min(points, 5000))
+
+    series = history.price_points(get_db(), pid, start, end, points, method)
+    return jsonify({
+        "property_id": pid,
+        "method": method,
+        "points": [{"ts": ts, "changed_at": history.format_ts(ts), "price": price} for ts, price in series],
+    })
+
+@app.route("/api/v1/properties/<int:pid>/comparables")
+def api_comparables(pid):
+    try:
+        k = int(request.args.get("k", comparables.COMPARABLES_K))
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+    k = max(1, min(k, 50))
+
+    conn = get_db()
+    p = conn.execute("SELECT * FROM properties WHERE id = ?", (pid,)).fetchone()
+    if p is None:
+        return jsonify({"error": "property not found"}), 404
+    return jsonify({"property_id": pid, "comparables": comparables.similar(conn, p, k)})
+
+@app.route("/admin/models", methods=["GET", "POST"])
+def admin_models():
+    # POST re-reads model/registry.json now instead of at the next periodic check
+    if request.method == "POST":
+        valuation.load_model()
+    return jsonify(valuation.model_versions())
+
+@app.route("/admin/risk")
+def admin_risk():
+    # risk_scan is filled by scan.py; filter by level / anomaly flag, riskiest first
+    level = request.args.get("level", "High")
+    if level not in ("Low", "Medium", "High", "all"):
+        level = "High"
+    flag = request.args.get("flag", "").strip()
+    after = request.args.get("after", "").strip()
+    per_page = 50
+
+    conn = get_db()
+    if not has_table(conn, "risk_scan"):
+        return "Run migrations first", 503
+
+    sql = """
+        SELECT r.property_id, r.risk_score, r.risk_level, r.anomaly_mask, r.deal_rating,
+               r.investment_score, r.scanned_at, p.city, p.location, p.sqft, p.bhk, p.bath,
+               p.listed_price, p.predicted_price
+        FROM risk_scan r
+        JOIN properties p ON p.id = r.property_id
+        WHERE 1=1
+    """
+    params = []
+    if level != "all":
+        sql += " AND r.risk_level = ?"
+        params.append(level)
+    if flag.isdigit() and int(flag) < len(valuation.ANOMALY_FLAGS):
+        sql += " AND r.anomaly_mask & ? != 0"
+        params.append(1 << int(flag))
+    try:
+        seek = parse_cursor(after, "risk_score") if after else None
+    except ValueError:
+        seek = None  # malformed cursor: first page
+    if seek:
+        sql += " AND (r.risk_score, r.property_id) < (?, ?)"
+        params += seek
+    sql += " ORDER BY r.risk_score DESC, r.property_id DESC LIMIT ?"
+    params.append(per_page)
+
+    rows = []
+    for r in conn.execute(sql, params).fetchall():
+        rows.append(dict(r, flags=valuation.flags_from_mask(r["anomaly_mask"]), scanned=history.format_ts(r["scanned_at"])))
+
+    counts = dict(conn.execute("SELECT risk_level, COUNT(*) FROM risk_scan GROUP BY risk_level").fetchall())
+    next_cursor = None
+    if len(rows) == per_page:
+        next_cursor = f"{rows[-1]['risk_score']}_{rows[-1]['property_id']}"
+
+    return render_template("admin_risk.html", rows=rows, level=level, flag=flag, counts=counts,
+                           flag_names=valuation.ANOMALY_FLAGS, next_cursor=next_cursor)
 
 @app.route("/admin/inquiries")
 def admin_inquiries():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cur = conn.cursor()
 
     cur.execute("""
@@ -539,7 +713,6 @@ def admin_inquiries():
         ORDER BY i.id DESC
     """)
     rows = cur.fetchall()
-    conn.close()
 
     inquiries = []
     for r in rows:
@@ -562,27 +735,36 @@ def admin_inquiries():
 def update_price(pid):
     new_price = float(request.form["new_price"])
 
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = get_db()
     cur = conn.cursor()
 
-    cur.execute("SELECT listed_price FROM properties WHERE id = ?", (pid,))
+    cur.execute("SELECT * FROM properties WHERE id = ?", (pid,))
     row = cur.fetchone()
     if row is None:
-        conn.close()
         return "Property not found", 404
 
     old_price = float(row["listed_price"])
 
     if new_price != old_price:
         cur.execute("UPDATE properties SET listed_price = ? WHERE id = ?", (new_price, pid))
+        # Fair value doesn't depend on the asking price; only the derived scores move
+        if is_current(row):
+            store_valuations(conn, [
+                score_listing(new_price, row["predicted_price"], row["sqft"], row["bath"], row["bhk"])
+                + (row["model_version"], pid)
+            ])
+        else:
+            cur.execute("SELECT * FROM properties WHERE id = ?", (pid,))
+            cached_valuations(conn, [cur.fetchone()])
+        now = datetime.now()
         cur.execute("""
-            INSERT INTO price_history (property_id, old_price, new_price, changed_at)
-            VALUES (?, ?, ?, ?)
-        """, (pid, old_price, new_price, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            INSERT INTO price_history (property_id, old_price, new_price, changed_at, changed_ts)
+            VALUES (?, ?, ?, ?, ?)
+        """, (pid, old_price, new_price, now.strftime("%Y-%m-%d %H:%M:%S"), int(now.timestamp())))
         conn.commit()
+        invalidate_listing_cache()
+        comparables.add(pid, row["city"], row["location"], row["sqft"], row["bath"], row["bhk"], new_price)
 
-    conn.close()
     return redirect(f"/property/{pid}")
 
 if __name__ == "__main__":
@@ -0,0 +1,111 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+# Micro-batching for the model: request threads submit single listings, one
+# background thread drains whatever arrived in the last few milliseconds (or up
+# to BATCH_MAX_SIZE rows) and scores it with one vectorized predict call.
+
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 2))
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 256))
+
+
+class MicroBatcher:
+    def __init__(self, score, lookup=None, max_wait_ms=BATCH_MAX_WAIT_MS, max_size=BATCH_MAX_SIZE):
+        # score(rows) -> [result, ...]; lookup(row) -> cached result or None skips the queue
+        self.score = score
+        self.lookup = lookup
+        self.max_wait = max_wait_ms / 1000
+        self.max_size = max_size
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+        self.batches = 0
+        self.items = 0
+        self.fast_path = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+
+    def _ensure_worker(self):
+        # started lazily and per process: gunicorn forks workers from a preloaded app,
+        # and threads don't survive the fork
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, name="micro-batcher", daemon=True).start()
+                self._pid = os.getpid()
+
+    def submit(self, row):
+        fut = Future()
+        if self.lookup is not None:
+            hit = self.lookup(row)
+            if hit is not None:
+                with self._lock:  # request threads race here; the worker's counters are single-threaded
+                    self.fast_path += 1
+                fut.set_result(hit)
+                return fut
+        self._ensure_worker()
+        self._queue.put((row, fut, time.perf_counter()))
+        return fut
+
+    def predict(self, row, timeout=None):
+        return self.submit(row).result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_size:
+            # whatever piled up while the last batch was scoring goes in without waiting
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                results = self.score([row for row, _, _ in batch])
+            except Exception as e:
+                for _, fut, _ in batch:
+                    fut.set_exception(e)
+                results = None
+            if results is not None:
+                for (_, fut, _), r in zip(batch, results):
+                    fut.set_result(r)
+
+            delays = [started - t for _, _, t in batch]
+            self.batches += 1
+            self.items += len(batch)
+            self.queue_delay_total += sum(delays)
+            self.queue_delay_max = max(self.queue_delay_max, max(delays))
+
+    def stats(self):
+        batches = self.batches or 1
+        items = self.items or 1
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "fast_path": self.fast_path,
+            "avg_batch_size": round(self.items / batches, 2),
+            "avg_fill": round(self.items / batches / self.max_size, 4),
+            "avg_queue_delay_ms": round(self.queue_delay_total / items * 1000, 3),
+            "max_queue_delay_ms": round(self.queue_delay_max * 1000, 3),
+            "pending": self._queue.qsize(),
+            "max_wait_ms": self.max_wait * 1000,
+            "max_size": self.max_size,
+        }
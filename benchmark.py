@@ -0,0 +1,376 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import datetime
+import platform
+import tempfile
+import statistics
+import subprocess
+import multiprocessing
+
+import joblib
+
+from migrations import BASE_DIR, migrate
+
+# Synthetic-data benchmarks. Nothing here touches database.db.
+#   python benchmark.py queries --rows 1000000
+#   python benchmark.py predict
+#   python benchmark.py --json bench.json app --rows 1000 100000 1000000
+
+
+def model_locations():
+    columns = joblib.load(os.path.join(BASE_DIR, "model", "model_columns.pkl"))
+    return sorted(c.replace("site_location_", "") for c in columns if c.startswith("site_location_"))
+
+
+def generate_properties(conn, n, locations, seed=42, chunk=50000):
+    rnd = random.Random(seed)
+    with conn:
+        for start in range(0, n, chunk):
+            rows = []
+            for _ in range(min(chunk, n - start)):
+                bhk = rnd.randint(1, 5)
+                sqft = rnd.randint(400, 4000)
+                rows.append((
+                    rnd.choice(locations), sqft, rnd.randint(1, bhk + 1), bhk,
+                    round(sqft * rnd.uniform(0.03, 0.12), 2), None
+                ))
+            conn.executemany("""
+                INSERT INTO properties (location, sqft, bath, bhk, listed_price, image)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+
+
+# generated price changes are spread over this window, in order, with some jitter
+HISTORY_START = datetime.datetime(2025, 1, 1)
+HISTORY_SPAN_S = 365 * 86400
+
+
+def generate_history(conn, n_properties, per_property, seed=42, chunk=50000, first_pid=1):
+    # changed_at only, so this works on every schema version (m008 derives changed_ts from it)
+    rnd = random.Random(seed)
+    step = HISTORY_SPAN_S / max(1, per_property)
+    with conn:
+        rows = []
+        for pid in range(first_pid, first_pid + n_properties):
+            price = rnd.uniform(30, 300)
+            for i in range(per_property):
+                new_price = round(price * rnd.uniform(0.95, 1.05), 2)
+                at = HISTORY_START + datetime.timedelta(seconds=int((i + rnd.random()) * step))
+                rows.append((pid, price, new_price, at.strftime("%Y-%m-%d %H:%M:%S")))
+                price = new_price
+            if len(rows) >= chunk:
+                conn.executemany("""
+                    INSERT INTO price_history (property_id, old_price, new_price, changed_at)
+                    VALUES (?, ?, ?, ?)
+                """, rows)
+                rows = []
+        if rows:
+            conn.executemany("""
+                INSERT INTO price_history (property_id, old_price, new_price, changed_at)
+                VALUES (?, ?, ?, ?)
+            """, rows)
+
+
+def generate_inquiries(conn, n, n_properties, seed=42):
+    rnd = random.Random(seed)
+    with conn:
+        conn.executemany("""
+            INSERT INTO inquiries (property_id, name, phone, message)
+            VALUES (?, ?, ?, ?)
+        """, ((rnd.randint(1, n_properties), "Buyer", "9999999999", "Interested") for _ in range(n)))
+
+
+def timed(fn, repeat, before=None):
+    # before() runs untimed ahead of every sample (e.g. to drop a cache)
+    samples = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def random_listings(n, locations, seed=7):
+    rnd = random.Random(seed)
+    return [(rnd.choice(locations), rnd.randint(400, 4000), rnd.randint(1, 5), rnd.randint(1, 5))
+            for _ in range(n)]
+
+
+def hot_queries(n, locations):
+    # The statements app.py issues on its hot paths, with representative parameters
+    loc = locations[len(locations) // 2]
+    pid = max(1, n // 2)
+    hist_pid = max(1, min(n, 10000) // 2)  # generate_history only covers the first 10k ids
+    start = int(HISTORY_START.timestamp())
+    width = HISTORY_SPAN_S // 199  # history.HISTORY_MAX_POINTS buckets over the window
+    return [
+        ("home_location_price_range",
+         "SELECT * FROM properties WHERE location = ? AND listed_price >= ? AND listed_price <= ? "
+         "ORDER BY listed_price ASC, id ASC LIMIT 9", (loc, 50, 120)),
+        ("home_bhk_price_desc",
+         "SELECT * FROM properties WHERE bhk = ? ORDER BY listed_price DESC, id DESC LIMIT 9", (3,)),
+        ("home_price_range_count",
+         "SELECT COUNT(*) FROM (SELECT * FROM properties WHERE listed_price >= ? AND listed_price <= ?)", (80, 90)),
+        ("home_distinct_locations",
+         "SELECT DISTINCT location FROM properties ORDER BY location", ()),
+        ("inquiries_for_property",
+         "SELECT * FROM inquiries WHERE property_id = ?", (pid,)),
+        # the three statements history.price_points issues
+        ("price_history_first",
+         "SELECT changed_ts, old_price FROM price_history WHERE property_id = ? "
+         "ORDER BY changed_ts, id LIMIT 1", (hist_pid,)),
+        ("price_history_window",
+         "SELECT changed_ts, new_price FROM price_history WHERE property_id = ? AND changed_ts >= ? "
+         "ORDER BY changed_ts, id", (hist_pid, start)),
+        ("price_history_buckets",
+         "SELECT MAX(changed_ts), new_price FROM price_history WHERE property_id = ? "
+         "GROUP BY (changed_ts - ?) / ? ORDER BY 1", (hist_pid, start, width)),
+    ]
+
+
+def run_queries(conn, queries, repeat):
+    out = {}
+    for name, sql, params in queries:
+        try:
+            plan = [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        except sqlite3.OperationalError as e:
+            # e.g. price_history.changed_ts before m008
+            out[name] = {"p50_ms": None, "p99_ms": None, "plan": [f"n/a: {e}"]}
+            continue
+        out[name] = dict(timed(lambda: conn.execute(sql, params).fetchall(), repeat), plan=plan)
+    return out
+
+
+def bench_queries(args):
+    locations = model_locations()
+    path = os.path.join(tempfile.mkdtemp(prefix="valuestate-bench-"), "bench.db")
+    conn = sqlite3.connect(path)
+
+    # schema as it was before the hot-path indexes
+    migrate(conn, target=2)
+    t0 = time.perf_counter()
+    generate_properties(conn, args.rows, locations)
+    generate_history(conn, min(args.rows, 10000), 20)
+    generate_inquiries(conn, max(1, args.rows // 10), args.rows)
+    print(f"generated {args.rows} properties in {time.perf_counter() - t0:.1f}s ({path})", file=sys.stderr)
+
+    queries = hot_queries(args.rows, locations)
+    before = run_queries(conn, queries, args.repeat)
+
+    t0 = time.perf_counter()
+    migrate(conn)
+    index_s = time.perf_counter() - t0
+    after = run_queries(conn, queries, args.repeat)
+    conn.close()
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+
+    result = {"rows": args.rows, "index_build_s": round(index_s, 2), "before": before, "after": after}
+    for name, _sql, _params in queries:
+        was = before[name]["p50_ms"]
+        print(f"{name:30s} {'n/a' if was is None else f'{was:.3f}':>10s} ms -> {after[name]['p50_ms']:>8.3f} ms")
+        print(f"{'':30s} before: {' | '.join(before[name]['plan'])}")
+        print(f"{'':30s} after:  {' | '.join(after[name]['plan'])}")
+    return result
+
+
+def bench_predict(args):
+    import valuation
+
+    locations = model_locations()
+    rows = random_listings(args.n, locations)
+    valuation.predict_prices(rows[:10])  # load the model outside the timings
+
+    def throughput(fn):
+        valuation.clear_caches()
+        t0 = time.perf_counter()
+        fn()
+        return round(args.n / (time.perf_counter() - t0), 1)
+
+    single = throughput(lambda: [valuation.predict_price(*r) for r in rows])
+    result = {"n": args.n, "engine": "flat" if valuation.get_forest() is not None else "sklearn",
+              "single_rows_per_s": single, "batch_rows_per_s": {}}
+    print(f"{'single':>12s} {single:>12,.0f} rows/s")
+    for size in args.batch_sizes:
+        rate = throughput(lambda: [valuation.predict_prices(rows[i:i + size]) for i in range(0, args.n, size)])
+        result["batch_rows_per_s"][str(size)] = rate
+        print(f"{'batch ' + str(size):>12s} {rate:>12,.0f} rows/s")
+
+    # every row already cached
+    t0 = time.perf_counter()
+    valuation.predict_prices(rows)
+    result["cached_rows_per_s"] = round(args.n / (time.perf_counter() - t0), 1)
+    return result
+
+
+# ---- Flask routes on a synthetic catalog ----
+
+LONG_HISTORY_PIDS = 5  # pids 1..5 get --history price changes each
+
+HOME_FILTERS = {
+    "all": {},
+    "location": {"location": None},  # filled with a real location
+    "bhk": {"bhk": "3"},
+    "price_range": {"min_price": "50", "max_price": "120"},
+    "search": {"q": None},
+    "rating": {"rating": "Excellent"},
+}
+HOME_SORTS = ["new", "price_asc", "price_desc", "score"]
+HOME_PAGES = ["first", "cursor", "offset"]  # page 1, page 2 via ?after=, page 10 via OFFSET
+
+
+def build_catalog(path, rows, history):
+    locations = model_locations()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    migrate(conn)
+    generate_properties(conn, rows, locations)
+    n_long = min(LONG_HISTORY_PIDS, rows)
+    generate_history(conn, n_long, history)
+    generate_history(conn, max(0, min(rows, 10000) - n_long), 20, first_pid=n_long + 1)
+    generate_inquiries(conn, max(1, rows // 10), rows)
+    conn.close()
+    return locations
+
+
+def home_urls(client, location):
+    loc = location.replace(" ", "+")
+    urls = {}
+    for fname, params in HOME_FILTERS.items():
+        params = {k: v if v is not None else loc if k == "location" else loc[:4] for k, v in params.items()}
+        for sort in HOME_SORTS:
+            base = "/?" + "&".join(f"{k}={v}" for k, v in dict(params, sort=sort).items())
+            urls[f"{fname}/{sort}/first"] = base
+            html = client.get(base).get_data(as_text=True)
+            m = re.search(r"after=([^&\"]+)&amp;page=2|after=([^&\"]+)&page=2", html)
+            if m:
+                urls[f"{fname}/{sort}/cursor"] = f"{base}&after={m.group(1) or m.group(2)}&page=2"
+            urls[f"{fname}/{sort}/offset"] = f"{base}&page=10"
+    return urls
+
+
+def bench_app_size(workdir, rows, history, repeat, dashboard_repeat):
+    # Runs in a fresh process started with VALUESTATE_DB pointing into workdir,
+    # since migrations.DB_PATH (and so app.py's database) is fixed at import time
+    t0 = time.perf_counter()
+    locations = build_catalog(os.environ["VALUESTATE_DB"], rows, history)
+    generate_s = time.perf_counter() - t0
+
+    # importing app scores every row with the deployed model (refresh_valuations)
+    t0 = time.perf_counter()
+    import charts
+    charts.CHARTS_DIR = os.path.join(workdir, "charts")
+    import app as webapp
+    startup_s = time.perf_counter() - t0
+    client = webapp.app.test_client()
+
+    def get(url):
+        r = client.get(url)
+        assert r.status_code == 200, (url, r.status_code)
+
+    home = {}
+    for name, url in home_urls(client, locations[len(locations) // 2]).items():
+        home[name] = timed(lambda: get(url), repeat)
+
+    long_pid = 1
+    typical_pid = min(rows, LONG_HISTORY_PIDS + 1)
+    prop = {
+        f"history_{history}": timed(lambda: get(f"/property/{long_pid}"), repeat),
+        "history_20": timed(lambda: get(f"/property/{typical_pid}"), repeat),
+    }
+
+    def drop_chart_cache():
+        charts._memo.clear()
+        shutil.rmtree(charts.CHARTS_DIR, ignore_errors=True)
+
+    dashboard = {
+        "cold": timed(lambda: get("/dashboard"), dashboard_repeat, before=drop_chart_cache),
+        "warm": timed(lambda: get("/dashboard"), repeat),
+    }
+    return {"rows": rows, "generate_s": round(generate_s, 2), "startup_s": round(startup_s, 2),
+            "home": home, "property": prop, "dashboard": dashboard}
+
+
+def bench_app(args):
+    result = {}
+    # one spawned process per catalog size so each gets a clean app import
+    ctx = multiprocessing.get_context("spawn")
+    for rows in args.rows:
+        workdir = tempfile.mkdtemp(prefix="valuestate-bench-")
+        os.environ["VALUESTATE_DB"] = os.path.join(workdir, "bench.db")
+        try:
+            with ctx.Pool(1) as pool:
+                r = pool.apply(bench_app_size, (workdir, rows, args.history, args.repeat, args.dashboard_repeat))
+        finally:
+            del os.environ["VALUESTATE_DB"]
+            shutil.rmtree(workdir, ignore_errors=True)
+        result[str(rows)] = r
+
+        print(f"== {rows} properties (generate {r['generate_s']}s, app startup {r['startup_s']}s)")
+        for name, t in r["home"].items():
+            print(f"  home {name:32s} p50 {t['p50_ms']:>9.3f} ms  p99 {t['p99_ms']:>9.3f} ms")
+        for name, t in r["property"].items():
+            print(f"  property {name:28s} p50 {t['p50_ms']:>9.3f} ms  p99 {t['p99_ms']:>9.3f} ms")
+        for name, t in r["dashboard"].items():
+            print(f"  dashboard {name:27s} p50 {t['p50_ms']:>9.3f} ms  p99 {t['p99_ms']:>9.3f} ms")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ValueState benchmarks on synthetic data")
+    parser.add_argument("--json", help="write results to this file")
+    sub = parser.add_subparsers(dest="suite", required=True)
+
+    p = sub.add_parser("queries", help="hot SQL queries before/after the index migration")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(run=bench_queries)
+
+    p = sub.add_parser("predict", help="predict_price one at a time vs predict_prices batches")
+    p.add_argument("--n", type=int, default=20000, help="distinct listings scored per run")
+    p.add_argument("--batch-sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    p.set_defaults(run=bench_predict)
+
+    p = sub.add_parser("app", help="home / property / dashboard latency through the Flask app")
+    p.add_argument("--rows", type=int, nargs="+", default=[1000, 100000, 1000000])
+    p.add_argument("--history", type=int, default=5000, help="price changes on the long-history listings")
+    p.add_argument("--repeat", type=int, default=20)
+    p.add_argument("--dashboard-repeat", type=int, default=3, help="cold dashboard renders")
+    p.set_defaults(run=bench_app)
+
+    args = parser.parse_args(argv)
+    result = {
+        "suite": args.suite,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": args.run(args),
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,11 @@
 import sqlite3
 import random
-import joblib
-import pandas as pd
 
-# Load model + columns (same as your app)
-model = joblib.load("model/pune_house_price_model.pkl")
-columns = joblib.load("model/model_columns.pkl")
+from valuation import active_models, predict_versioned, score_listing
+from migrations import migrate
 
-def predict_price(location, sqft, bath, bhk):
-    x = pd.DataFrame(columns=columns)
-    x.loc[0] = 0
-    x.loc[0, "total_sqft"] = sqft
-    x.loc[0, "bath"] = bath
-    x.loc[0, "bhk"] = bhk
-
-    loc_col = "site_location_" + location
-    if loc_col in columns:
-        x.loc[0, loc_col] = 1
-
-    return float(model.predict(x)[0])
-
-locations = sorted([c.replace("site_location_", "") for c in columns if c.startswith("site_location_")])
+# (city, location) for every city that has a model, so each listing is scored by its own city's model
+locations = [(city, loc) for city, m in sorted(active_models().items()) for loc in m.locations]
 
 # Different images
 images = [
@@ -53,16 +38,21 @@ def make_listed_price(pred, bucket):
 
 conn = sqlite3.connect("database.db")
 cur = conn.cursor()
+migrate(conn)
 
 N = 60  # change count
+listings = []
 for i in range(N):
-    location = random.choice(locations)
+    city, location = random.choice(locations)
     bhk = random.randint(1, 4)
     bath = random.randint(1, bhk + 1)
     sqft = random.randint(600, 2600)
+    listings.append((location, sqft, bath, bhk, city))
 
-    pred = predict_price(location, sqft, bath, bhk)
+# one model call for the whole batch
+preds, versions = predict_versioned(listings)
 
+for (location, sqft, bath, bhk, city), pred, version in zip(listings, preds, versions):
     r = random.random()
     if r < 0.50:
         bucket = "fair"
@@ -73,11 +63,13 @@ for i in range(N):
 
     listed_price = make_listed_price(pred, bucket)
     image = random.choice(images)
+    valuation = score_listing(listed_price, pred, sqft, bath, bhk)
 
     cur.execute("""
-        INSERT INTO properties (location, sqft, bath, bhk, listed_price, image)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (location, sqft, bath, bhk, listed_price, image))
+        INSERT INTO properties (location, sqft, bath, bhk, listed_price, image, city,
+                                predicted_price, deal_rating, investment_score, risk_score, model_version)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (location, sqft, bath, bhk, listed_price, image, city) + valuation + (version,))
 
 conn.commit()
 conn.close()
@@ -0,0 +1,112 @@
+import os
+import io
+import json
+import time
+import hashlib
+import threading
+
+from metrics import timer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHARTS_DIR = os.path.join(BASE_DIR, "static", "charts")
+
+# Superseded PNGs are kept this long so pages rendered by other workers don't 404
+STALE_CHART_TTL = 300
+
+# pyplot keeps global state, so only one thread draws at a time
+_render_lock = threading.Lock()
+_memo = {}
+_pyplot = None
+
+
+def pyplot():
+    # matplotlib is only imported the first time a chart actually has to be drawn
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot
+        _pyplot = matplotlib.pyplot
+    return _pyplot
+
+
+def data_version(conn):
+    # bumped by triggers on properties (migrations.m005_data_version)
+    return conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()[0]
+
+
+def write_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def save_chart(name):
+    # Current pyplot figure -> static/charts/<name>-<content hash>.png, returns the filename
+    plt = pyplot()
+    buf = io.BytesIO()
+    plt.tight_layout()
+    plt.savefig(buf, format="png")
+    plt.close()
+    data = buf.getvalue()
+
+    filename = f"{name}-{hashlib.sha1(data).hexdigest()[:12]}.png"
+    path = os.path.join(CHARTS_DIR, filename)
+    if not os.path.exists(path):
+        write_atomic(path, data)
+    return filename
+
+
+def remove_stale_charts(keep):
+    prefixes = tuple(f.rsplit("-", 1)[0] + "-" for f in keep)
+    cutoff = time.time() - STALE_CHART_TTL
+    for f in os.listdir(CHARTS_DIR):
+        if f.endswith(".png") and f.startswith(prefixes) and f not in keep:
+            path = os.path.join(CHARTS_DIR, f)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def read_manifest(path, key):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if manifest.get("key") != key:
+        return None
+    payload = manifest["payload"]
+    if not all(os.path.exists(os.path.join(CHARTS_DIR, f)) for f in payload["charts"].values()):
+        return None
+    return payload
+
+
+def cached_charts(name, key, build):
+    # build() -> {"charts": {chart: filename}, ...}; only re-run when key changes.
+    # A JSON manifest per chart set lets other worker processes reuse the render.
+    key = list(key)
+    hit = _memo.get(name)
+    if hit and hit[0] == key:
+        return hit[1]
+
+    os.makedirs(CHARTS_DIR, exist_ok=True)
+    manifest_path = os.path.join(CHARTS_DIR, f"{name}.json")
+
+    with _render_lock:
+        hit = _memo.get(name)
+        if hit and hit[0] == key:
+            return hit[1]
+
+        payload = read_manifest(manifest_path, key)
+        if payload is None:
+            with timer("charts"):
+                payload = build()
+            write_atomic(manifest_path, json.dumps({"key": key, "payload": payload}).encode())
+            remove_stale_charts(set(payload["charts"].values()))
+
+        _memo[name] = (key, payload)
+        return payload
@@ -0,0 +1,194 @@
+import os
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from charts import data_version
+from metrics import timed
+
+# "Similar properties" for the property page: one KD-tree per (city, location) over
+# (log sqft, bhk, bath, log price-per-sqft), built the first time that location is
+# asked for and kept in memory.
+#
+# New and repriced listings go into a small pending buffer that's searched by brute
+# force next to the tree; once it grows past a fraction of the tree, the tree is
+# rebuilt. Writes made by other workers are picked up by sync(), which only runs
+# a query when data_version has moved and then reads just the new properties rows
+# and price_history entries since the last sync.
+
+COMPARABLES_K = int(os.environ.get("COMPARABLES_K", 6))
+COMPARABLES_MAX_LOCATIONS = int(os.environ.get("COMPARABLES_MAX_LOCATIONS", 512))
+REBUILD_MIN_PENDING = 64
+REBUILD_FRACTION = 0.1
+
+# one unit of distance ~ one bedroom, one bathroom, or ~20% in size / price per sqft
+SCALE = np.array([1 / 0.2, 1.0, 1.0, 1 / 0.2])
+
+
+def point(sqft, bath, bhk, price):
+    sqft = max(float(sqft), 1.0)
+    pps = max(float(price), 0.01) * 100000 / sqft
+    return (math.log(sqft) * SCALE[0], bhk * SCALE[1], bath * SCALE[2], math.log(pps) * SCALE[3])
+
+
+def points(values):
+    # point() over [(sqft, bath, bhk, price), ...] at once
+    v = np.array(values, dtype=np.float64).reshape(-1, 4)
+    sqft = np.maximum(v[:, 0], 1.0)
+    pps = np.maximum(v[:, 3], 0.01) * 100000 / sqft
+    return np.column_stack([np.log(sqft), v[:, 2], v[:, 1], np.log(pps)]) * SCALE
+
+
+class LocationIndex:
+    def __init__(self, rows):
+        # rows: [(id, sqft, bath, bhk, listed_price), ...]
+        self.live = {r[0]: r[1:] for r in rows}
+        self.rebuild()
+
+    def rebuild(self):
+        # scipy only on first use, so it stays out of app cold start
+        from scipy.spatial import cKDTree
+
+        self.ids = np.fromiter(self.live, dtype=np.int64, count=len(self.live))
+        self.values = [self.live[i] for i in self.ids.tolist()]
+        pts = points(self.values)
+        self.tree = cKDTree(pts) if len(pts) else None
+        self.pending = []  # (id, values, point) added since the tree was built
+        self.stale = 0     # tree entries superseded by a pending one
+
+    def upsert(self, pid, values):
+        old = self.live.get(pid)
+        if old == values:
+            return
+        if old is not None and not any(p[0] == pid for p in self.pending):
+            self.stale += 1
+        self.live[pid] = values
+        self.pending.append((pid, values, point(*values)))
+
+    def needs_rebuild(self):
+        return len(self.pending) + self.stale > max(REBUILD_MIN_PENDING, len(self.ids) * REBUILD_FRACTION)
+
+    def query(self, q, k, exclude=None):
+        # -> [(distance, id, (sqft, bath, bhk, price)), ...] nearest first
+        found = []
+        if self.tree is not None:
+            # superseded entries and the listing itself get skipped, so widen the
+            # search until k current ones turn up (or the tree runs out)
+            n = k + 1
+            while True:
+                n = min(n, len(self.ids))
+                dist, idx = self.tree.query(q, k=n)
+                found = []
+                for d, i in zip(np.atleast_1d(dist), np.atleast_1d(idx)):
+                    pid = int(self.ids[i])
+                    # a tree entry is current only if nothing newer replaced it
+                    if pid != exclude and self.live.get(pid) == self.values[i]:
+                        found.append((float(d), pid, self.values[i]))
+                if len(found) >= k or n == len(self.ids):
+                    break
+                n *= 4
+        if self.pending:
+            pts = np.array([p[2] for p in self.pending])
+            dist = np.sqrt(((pts - q) ** 2).sum(axis=1))
+            for d, (pid, values, _) in zip(dist.tolist(), self.pending):
+                if self.live.get(pid) == values:
+                    found.append((d, pid, values))
+
+        found.sort()
+        out, seen = [], {exclude}
+        for d, pid, values in found:
+            if pid not in seen:
+                seen.add(pid)
+                out.append((d, pid, values))
+                if len(out) == k:
+                    break
+        return out
+
+
+_lock = threading.Lock()
+_indexes = OrderedDict()  # (city, location) -> LocationIndex, least recently used first
+_synced = None            # (data_version, last properties id, last price_history id)
+
+
+def index_for(conn, city, location):
+    key = (city, location)
+    idx = _indexes.get(key)
+    if idx is None:
+        rows = conn.execute("""
+            SELECT id, sqft, bath, bhk, listed_price FROM properties
+            WHERE location = ? AND city = ?
+        """, (location, city)).fetchall()
+        idx = _indexes[key] = LocationIndex([tuple(r) for r in rows])
+        while len(_indexes) > COMPARABLES_MAX_LOCATIONS:
+            _indexes.popitem(last=False)
+    _indexes.move_to_end(key)
+    if idx.needs_rebuild():
+        idx.rebuild()
+    return idx
+
+
+def apply_rows(rows):
+    # properties rows (id, city, location, sqft, bath, bhk, listed_price) into any loaded index
+    for r in rows:
+        idx = _indexes.get((r[1], r[2]))
+        if idx is not None:
+            idx.upsert(r[0], tuple(r[3:]))
+
+
+def sync(conn):
+    # catch up with inserts and price changes made since the last call (any process)
+    global _synced
+    ver = data_version(conn)
+    if _synced is not None and _synced[0] == ver:
+        return
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM properties").fetchone()[0]
+    last_change = conn.execute("SELECT COALESCE(MAX(id), 0) FROM price_history").fetchone()[0]
+    if _synced is not None and _indexes:
+        _, seen_id, seen_change = _synced
+        apply_rows(conn.execute("""
+            SELECT id, city, location, sqft, bath, bhk, listed_price FROM properties
+            WHERE id > ? AND id <= ?
+        """, (seen_id, last_id)).fetchall())
+        apply_rows(conn.execute("""
+            SELECT id, city, location, sqft, bath, bhk, listed_price FROM properties
+            WHERE id IN (SELECT property_id FROM price_history WHERE id > ? AND id <= ?)
+        """, (seen_change, last_change)).fetchall())
+    _synced = (ver, last_id, last_change)
+
+
+def add(pid, city, location, sqft, bath, bhk, listed_price):
+    # the writing process sees its own insert / price change right away
+    with _lock:
+        idx = _indexes.get((city, location))
+        if idx is not None:
+            idx.upsert(pid, (sqft, bath, bhk, listed_price))
+
+
+@timed("comparables")
+def similar(conn, p, k=COMPARABLES_K):
+    # p: properties row -> [{id, sqft, bath, bhk, listed_price, price_per_sqft, distance}, ...]
+    q = np.array(point(p["sqft"], p["bath"], p["bhk"], p["listed_price"]))
+    with _lock:
+        sync(conn)
+        hits = index_for(conn, p["city"], p["location"]).query(q, k, exclude=p["id"])
+    return [{
+        "id": pid,
+        "sqft": sqft,
+        "bath": bath,
+        "bhk": bhk,
+        "listed_price": price,
+        "price_per_sqft": round(price * 100000 / sqft) if sqft else None,
+        "distance": round(d, 3),
+    } for d, pid, (sqft, bath, bhk, price) in hits]
+
+
+def stats():
+    with _lock:
+        return {
+            "locations": len(_indexes),
+            "listings": sum(len(i.live) for i in _indexes.values()),
+            "pending": sum(len(i.pending) for i in _indexes.values()),
+        }
+
@@ -1,44 +1,12 @@
 import sqlite3
 
-DB_PATH = "database.db"
+from migrations import DB_PATH, migrate
 
 conn = sqlite3.connect(DB_PATH)
 cur = conn.cursor()
 
-# Properties table (with image included from start)
-cur.execute("""
-CREATE TABLE IF NOT EXISTS properties (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    location TEXT NOT NULL,
-    sqft REAL NOT NULL,
-    bath INTEGER NOT NULL,
-    bhk INTEGER NOT NULL,
-    listed_price REAL NOT NULL,
-    image TEXT
-)
-""")
-
-# Inquiries table
-cur.execute("""
-CREATE TABLE IF NOT EXISTS inquiries (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    property_id INTEGER,
-    name TEXT,
-    phone TEXT,
-    message TEXT
-)
-""")
-
-# Price history table (for AI tracking - very good feature for your project)
-cur.execute("""
-CREATE TABLE IF NOT EXISTS price_history (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    property_id INTEGER NOT NULL,
-    old_price REAL NOT NULL,
-    new_price REAL NOT NULL,
-    changed_at TEXT NOT NULL
-)
-""")
+# Tables and indexes are created by the versioned migrations in migrations.py
+migrate(conn)
 
 # OPTIONAL: Insert sample data only if table is empty
 cur.execute("SELECT COUNT(*) FROM properties")
@@ -0,0 +1,83 @@
+import os
+import queue
+import sqlite3
+
+from flask import g
+
+from migrations import DB_PATH
+from metrics import TimedConnection
+
+# Shared SQLite connection layer: pooled connections reused across requests,
+# WAL journaling so readers don't block behind inquiry / price-update writes.
+
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 16))
+BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", 5000))
+CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", 20000))
+MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", 256 * 1024 * 1024))
+STATEMENT_CACHE = 256  # per-connection prepared statement cache
+
+
+def connect(path=DB_PATH):
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,  # pooled connections move between request threads
+        cached_statements=STATEMENT_CACHE,
+        factory=TimedConnection,  # query time shows up in /metrics
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")  # safe with WAL; fsync at checkpoint only
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, path=DB_PATH, size=POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect(self.path)
+
+    def release(self, conn):
+        # never hand a half-finished transaction to the next request
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+pool = ConnectionPool()
+
+
+def get_db():
+    # One pooled connection per request, returned on teardown
+    if "db" not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+def close_db(exc=None):
+    conn = g.pop("db", None)
+    if conn is not None:
+        pool.release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+import argparse
+
+import joblib
+import numpy as np
+
+# Lightweight inference for the RandomForest: the fitted trees are flattened into a
+# handful of NumPy node arrays and every tree is walked at once, level by level.
+#   python forest.py            # export next to the model and verify against sklearn
+#
+# Listings are one-hot encoded with a single active site_location_* column, so the
+# engine never builds the 100+ column feature row: a node on a location column just
+# checks "is this the listing's location", and every other non-numeric column is 0.
+
+NUMERIC = ("total_sqft", "bath", "bhk")
+ZERO_SLOT = len(NUMERIC)  # dense slot that always holds 0.0
+
+
+def flatten(model, columns):
+    # fitted RandomForestRegressor -> dict of concatenated node arrays
+    numeric_cols = [columns.get_loc(c) for c in NUMERIC]
+    lefts, rights, features, thresholds, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for est in model.estimators_:
+        t = est.tree_
+        n = t.node_count
+        node = np.arange(n)
+        leaf = t.children_left < 0
+        lefts.append(np.where(leaf, node, t.children_left) + offset)
+        rights.append(np.where(leaf, node, t.children_right) + offset)
+        features.append(np.where(leaf, -1, t.feature))
+        thresholds.append(np.where(leaf, np.inf, t.threshold))
+        values.append(t.value.reshape(n, -1)[:, 0])
+        roots.append(offset)
+        max_depth = max(max_depth, t.max_depth)
+        offset += n
+
+    feature = np.concatenate(features).astype(np.int32)
+    # which dense slot a node reads: sqft / bath / bhk, else the constant zero
+    slot = np.full(feature.shape, ZERO_SLOT, dtype=np.int8)
+    for i, col in enumerate(numeric_cols):
+        slot[feature == col] = i
+
+    return {
+        # children[0] = left, children[1] = right; leaves point at themselves
+        "children": np.stack([np.concatenate(lefts), np.concatenate(rights)]).astype(np.int32),
+        "feature": feature,
+        "slot": slot,
+        "threshold": np.concatenate(thresholds).astype(np.float64),
+        "value": np.concatenate(values).astype(np.float64),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "max_depth": int(max_depth),
+    }
+
+
+class FlatForest:
+    def __init__(self, arrays):
+        self.children = arrays["children"]
+        self.feature = arrays["feature"]
+        self.slot = arrays["slot"]
+        self.threshold = arrays["threshold"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.max_depth = arrays["max_depth"]
+
+    def predict(self, loc_cols, sqft, bath, bhk):
+        # loc_cols: column index of each listing's site_location_* feature (-1 if unknown)
+        loc_cols = np.asarray(loc_cols, dtype=np.int32)
+        n = len(loc_cols)
+        # sklearn compares float32 inputs against float64 thresholds; do the same
+        dense = np.zeros((n, ZERO_SLOT + 1), dtype=np.float32)
+        dense[:, 0] = sqft
+        dense[:, 1] = bath
+        dense[:, 2] = bhk
+
+        idx = np.tile(self.roots, (n, 1))
+        row = np.arange(n)[:, None]
+        loc = loc_cols[:, None]
+        for _ in range(self.max_depth):
+            x = dense[row, self.slot[idx]]
+            x[self.feature[idx] == loc] = 1
+            go_right = x > self.threshold[idx]
+            idx = self.children[go_right.view(np.int8), idx]
+        return self.value[idx].mean(axis=1)
+
+
+def export(model, columns, path, version):
+    arrays = flatten(model, columns)
+    arrays["model_version"] = version
+    # uncompressed so load(mmap_mode="r") maps the node arrays straight from the page cache
+    joblib.dump(arrays, path)
+    return arrays
+
+
+def load(path, version):
+    # None if there's no export, or it was made from a different model file
+    if not os.path.exists(path):
+        return None
+    arrays = joblib.load(path, mmap_mode="r")
+    if arrays.get("model_version") != version:
+        return None
+    return FlatForest(arrays)
+
+
+def main(argv=None):
+    import valuation
+
+    parser = argparse.ArgumentParser(description="Export the RandomForest into flat NumPy node arrays")
+    parser.add_argument("--samples", type=int, default=2000, help="listings used to verify the export")
+    parser.add_argument("--tolerance", type=float, default=1e-6)
+    parser.add_argument("--city", default=valuation.DEFAULT_CITY, help="which registry model to export")
+    args = parser.parse_args(argv)
+
+    cm = valuation.get_city_model(args.city)
+    model = joblib.load(cm.model_path)
+    export(model, cm.columns, cm.forest_path, cm.version)
+    forest = load(cm.forest_path, cm.version)
+
+    rnd = np.random.default_rng(0)
+    names = list(cm.locations) + ["<unknown>"]
+    rows = [(names[rnd.integers(len(names))], int(rnd.integers(300, 5000)),
+             int(rnd.integers(1, 6)), int(rnd.integers(1, 6))) for _ in range(args.samples)]
+
+    import pandas as pd
+    keys = [cm.cache_key(*r) for r in rows]
+    x = pd.DataFrame(cm.build_features(keys), columns=cm.columns)
+    expected = model.predict(x)
+    got = forest.predict(*cm.sparse_features(keys))
+    err = float(np.max(np.abs(expected - got)))
+
+    def per_call_us(fn, n=200):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return (time.perf_counter() - t0) / n * 1e6
+
+    one = keys[:1]
+    x1 = x.iloc[:1]
+    sk_us = per_call_us(lambda: model.predict(x1))
+    flat_us = per_call_us(lambda: forest.predict(*cm.sparse_features(one)))
+
+    print(f"max |sklearn - flat| over {args.samples} listings: {err:.2e}")
+    print(f"single listing: sklearn {sk_us:,.0f} us, flat {flat_us:,.0f} us")
+    if err > args.tolerance:
+        os.remove(cm.forest_path)
+        print("❌ export does not match sklearn; removed", file=sys.stderr)
+        sys.exit(1)
+    print(f"✅ Exported {len(forest.value)} nodes to {cm.forest_path}")
+
+
+if __name__ == "__main__":
+    main()
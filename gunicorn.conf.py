@@ -0,0 +1,19 @@
+# gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# Import the app once in the master and fork workers from it, so module state
+# (the model, the location vocabulary) is shared copy-on-write instead of
+# being rebuilt in every worker.
+preload_app = True
+
+
+def when_ready(server):
+    # Models are loaded lazily; warm every city's in the master before workers are forked
+    import valuation
+    for m in valuation.active_models().values():
+        if m.get_forest() is None:
+            m.get_model()
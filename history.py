@@ -0,0 +1,107 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+# Price-history reads for the property page and the history API. Changes are read
+# by (property_id, changed_ts) range (migrations.m008_price_history_ts) and thinned
+# to at most HISTORY_MAX_POINTS, so feeds that reprice a listing thousands of
+# times don't turn into thousands of chart points.
+#   lttb:   Largest-Triangle-Three-Buckets over the rows in the window; keeps the shape
+#   bucket: last price per fixed-width time bucket, aggregated in SQL
+
+HISTORY_MAX_POINTS = int(os.environ.get("HISTORY_MAX_POINTS", 200))
+METHODS = ("lttb", "bucket")
+
+
+def lttb(x, y, n):
+    # indices of the n points that best preserve the line's shape; first and last always kept
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+
+    every = (size - 2) / (n - 2)
+    edges = (np.arange(n - 1) * every).astype(np.int64) + 1  # bucket i is [edges[i], edges[i + 1])
+    keep = np.empty(n, dtype=np.int64)
+    keep[0] = a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = (edges[i + 1], edges[i + 2]) if i + 2 < n - 1 else (size - 1, size)
+        avg_x = x[nlo:nhi].mean()
+        avg_y = y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    keep[-1] = size - 1
+    return keep
+
+
+def window_clause(start, end):
+    sql, params = "", []
+    if start is not None:
+        sql += " AND changed_ts >= ?"
+        params.append(start)
+    if end is not None:
+        sql += " AND changed_ts <= ?"
+        params.append(end)
+    return sql, params
+
+
+def price_points(conn, pid, start=None, end=None, max_points=HISTORY_MAX_POINTS, method="lttb"):
+    # -> [(changed_ts, price), ...] in time order; the first point is the price before the first change
+    where, params = window_clause(start, end)
+
+    first = conn.execute(f"""
+        SELECT changed_ts, old_price FROM price_history
+        WHERE property_id = ?{where}
+        ORDER BY changed_ts, id LIMIT 1
+    """, [pid] + params).fetchone()
+    if first is None:
+        return []
+
+    if method == "bucket":
+        lo, hi = conn.execute(f"""
+            SELECT MIN(changed_ts), MAX(changed_ts) FROM price_history WHERE property_id = ?{where}
+        """, [pid] + params).fetchone()
+        width = max(1, -(-(hi - lo + 1) // max(1, max_points - 1)))
+        # SQLite returns the bare columns from the row holding MAX(): the bucket's last change
+        rows = conn.execute(f"""
+            SELECT MAX(changed_ts), new_price FROM price_history
+            WHERE property_id = ?{where}
+            GROUP BY (changed_ts - ?) / ?
+            ORDER BY 1
+        """, [pid] + params + [lo, width]).fetchall()
+        return [(first[0], first[1])] + [(r[0], r[1]) for r in rows]
+
+    rows = conn.execute(f"""
+        SELECT changed_ts, new_price FROM price_history
+        WHERE property_id = ?{where}
+        ORDER BY changed_ts, id
+    """, [pid] + params).fetchall()
+    points = [(first[0], first[1])] + [(r[0], r[1]) for r in rows]
+    if len(points) <= max_points:
+        return points
+
+    x = np.fromiter((p[0] for p in points), dtype=np.float64, count=len(points))
+    y = np.fromiter((p[1] for p in points), dtype=np.float64, count=len(points))
+    return [points[i] for i in lttb(x, y, max_points)]
+
+
+def format_ts(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def parse_date(value, end_of_day=False):
+    # "2026-01-31" or "2026-01-31 12:00:00" (local time) -> unix seconds; None for blank.
+    # end_of_day makes a bare date inclusive, for the end of a window.
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        return int(datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timestamp())
+    except ValueError:
+        pass
+    try:
+        return int(datetime.strptime(value, "%Y-%m-%d").timestamp()) + (86399 if end_of_day else 0)
+    except ValueError:
+        raise ValueError(f"invalid date: {value!r}")
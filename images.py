@@ -0,0 +1,167 @@
+import os
+import sys
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import timer
+
+# Listing photos. add_property only hashes the upload and writes the original under its
+# content hash (so identical uploads share one file and same-named ones never collide);
+# resized JPEG + WebP variants are made afterwards by a small thread pool.
+#   static/uploads/<sha>.<ext>                original, what properties.image stores
+#   static/uploads/sized/<stem>-<width>.jpg   variants, one per IMAGE_WIDTHS entry
+#   static/uploads/sized/<stem>-<width>.webp
+# Templates ask for a width through variant(); until the variants exist they get the original.
+#   python images.py    # make variants for uploads that predate this (or whose job was lost)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_DIR = os.path.join(BASE_DIR, "static", "uploads")
+SIZED_DIR = os.path.join(UPLOAD_DIR, "sized")
+
+IMAGE_WIDTHS = (480, 1280)  # listing cards, property page
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+EXTENSIONS = {"jpg", "jpeg", "png", "webp", "gif", "bmp", "tiff"}
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_pending = set()  # stems with a variant job queued or running
+_ready = set()    # (stem, width) known to be on disk
+_broken = set()   # stems whose job failed; not retried until restart
+_stats = {"stored": 0, "duplicates": 0, "variants": 0, "failed": 0}
+
+
+def extension(filename):
+    ext = os.path.splitext(filename or "")[1].lstrip(".").lower()
+    return ext if ext in EXTENSIONS else "jpg"
+
+
+def sized_path(stem, width, fmt):
+    return os.path.join(SIZED_DIR, f"{stem}-{width}.{fmt}")
+
+
+def bump(key):
+    with _lock:
+        _stats[key] += 1
+
+
+def store_upload(file_storage):
+    # werkzeug FileStorage -> stored file name; variants are queued, not made here
+    data = file_storage.read()
+    name = f"{hashlib.sha256(data).hexdigest()[:24]}.{extension(file_storage.filename)}"
+    path = os.path.join(UPLOAD_DIR, name)
+    if os.path.exists(path):
+        bump("duplicates")
+    else:
+        # pid + thread: two request threads can store the same upload at once
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        bump("stored")
+    submit(name)
+    return name
+
+
+def pool():
+    # one pool per process, started lazily: gunicorn forks workers and threads don't survive it
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        with _lock:
+            if _pool_pid != os.getpid():
+                _pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="images")
+                _pending.clear()
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def submit(name):
+    stem = os.path.splitext(name)[0]
+    if all(os.path.exists(sized_path(stem, w, "webp")) for w in IMAGE_WIDTHS):
+        return None
+    executor = pool()  # first, since starting a pool resets _pending
+    with _lock:
+        if stem in _pending or stem in _broken:
+            return None
+        _pending.add(stem)
+    return executor.submit(run_job, name)
+
+
+def run_job(name):
+    stem = os.path.splitext(name)[0]
+    try:
+        with timer("images"):
+            make_variants(os.path.join(UPLOAD_DIR, name))
+    except Exception as e:
+        # a broken upload keeps being served as the original
+        bump("failed")
+        with _lock:
+            _broken.add(stem)
+        print(f"❌ image variants for {name}: {e}", file=sys.stderr)
+    finally:
+        with _lock:
+            _pending.discard(stem)
+
+
+def make_variants(path):
+    from PIL import Image, ImageOps
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    os.makedirs(SIZED_DIR, exist_ok=True)
+    with Image.open(path) as im:
+        im = ImageOps.exif_transpose(im).convert("RGB")
+        for width in IMAGE_WIDTHS:
+            out = im
+            if im.width > width:
+                out = im.resize((width, round(im.height * width / im.width)), Image.LANCZOS)
+            # webp last: submit() treats it as the marker that a width is done
+            for fmt, kwargs in (("jpg", {"format": "JPEG", "quality": JPEG_QUALITY, "optimize": True, "progressive": True}),
+                                ("webp", {"format": "WEBP", "quality": WEBP_QUALITY, "method": 4})):
+                target = sized_path(stem, width, fmt)
+                tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+                out.save(tmp, **kwargs)
+                os.replace(tmp, target)
+            bump("variants")
+
+
+def variant(name, width):
+    # template helper -> {"src": url, "webp": url or None} for the smallest variant >= width
+    if not name:
+        return None
+    if name.startswith("http"):
+        return {"src": name, "webp": None}
+    width = next((w for w in IMAGE_WIDTHS if w >= width), IMAGE_WIDTHS[-1])
+    stem = os.path.splitext(name)[0]
+    key = (stem, width)
+    if key not in _ready:
+        if not os.path.exists(sized_path(stem, width, "webp")):
+            # job lost (restart, crash) or never queued: queue it, serve the original meanwhile
+            if os.path.exists(os.path.join(UPLOAD_DIR, name)):
+                submit(name)
+            return {"src": f"/static/uploads/{name}", "webp": None}
+        _ready.add(key)
+    return {
+        "src": f"/static/uploads/sized/{stem}-{width}.jpg",
+        "webp": f"/static/uploads/sized/{stem}-{width}.webp",
+    }
+
+
+def stats():
+    with _lock:
+        return dict(_stats, pending=len(_pending))
+
+
+def main():
+    names = sorted(n for n in os.listdir(UPLOAD_DIR) if os.path.isfile(os.path.join(UPLOAD_DIR, n))
+                   and not n.endswith(".tmp"))
+    jobs = [f for f in (submit(n) for n in names) if f is not None]
+    for f in jobs:
+        f.result()
+    print(f"✅ Variants for {len(jobs)} of {len(names)} uploads ({stats()['failed']} failed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+
+import pandas as pd
+
+from migrations import DB_PATH, migrate
+from valuation import predict_versioned, score_listing
+
+# Stream the raw city datasets under data/ into properties.
+#   python import_csv.py data/Pune_house_data.csv data/Bangalore_house_data.csv "data/Delhi house data.csv"
+# Each chunk is normalized, scored with one predict call and written with one executemany.
+
+# Column names per dataset -> the fields properties needs.
+# price_scale converts the file's Price unit into lakhs.
+CITY_SCHEMAS = {
+    "Pune": {"location": "site_location", "bhk": "size", "sqft": "total_sqft", "bath": "bath",
+             "price": "price", "price_scale": 1},
+    "Bangalore": {"location": "location", "bhk": "size", "sqft": "total_sqft", "bath": "bath",
+                  "price": "price", "price_scale": 1},
+    "Delhi": {"location": "Locality", "bhk": "BHK", "sqft": "Area", "bath": "Bathroom",
+              "price": "Price", "price_scale": 1e-5},  # rupees
+}
+
+
+def detect_city(path):
+    header = set(pd.read_csv(path, nrows=0).columns)
+    for city, schema in CITY_SCHEMAS.items():
+        if {schema[k] for k in ("location", "bhk", "sqft", "bath", "price")} <= header:
+            return city
+    raise ValueError(f"Unrecognised dataset columns in {path}: {sorted(header)}")
+
+
+def parse_sqft(col):
+    # "1200", "2100 - 2850" (range -> midpoint); unit strings like "34.46Sq. Meter" are dropped
+    col = col.astype(str).str.strip()
+    parts = col.str.split("-", n=1, expand=True)
+    if parts.shape[1] == 1:
+        return pd.to_numeric(col, errors="coerce")
+    lo = pd.to_numeric(parts[0].str.strip(), errors="coerce")
+    hi = pd.to_numeric(parts[1].str.strip(), errors="coerce")
+    return lo.where(hi.isna(), (lo + hi) / 2)
+
+
+def normalize(chunk, schema):
+    out = pd.DataFrame({
+        "location": chunk[schema["location"]].astype("string").str.strip(),
+        # "2 BHK" / "4 Bedroom" / 3
+        "bhk": pd.to_numeric(chunk[schema["bhk"]].astype(str).str.extract(r"(\d+)")[0], errors="coerce"),
+        "sqft": parse_sqft(chunk[schema["sqft"]]),
+        "bath": pd.to_numeric(chunk[schema["bath"]], errors="coerce"),
+        "listed_price": pd.to_numeric(chunk[schema["price"]], errors="coerce") * schema["price_scale"],
+    })
+    out = out.dropna()
+    out = out[(out["location"] != "") & (out["sqft"] > 0) & (out["bhk"] > 0) & (out["listed_price"] > 0)]
+    out["bhk"] = out["bhk"].astype(int)
+    out["bath"] = out["bath"].astype(int)
+    out["listed_price"] = out["listed_price"].round(2)
+    return out
+
+
+def import_file(conn, path, city=None, chunksize=50000):
+    city = city or detect_city(path)
+    schema = CITY_SCHEMAS[city]
+    usecols = [schema[k] for k in ("location", "bhk", "sqft", "bath", "price")]
+    # properties.source; train.py skips rows imported from a file it already reads
+    source = os.path.basename(path)
+
+    read = skipped = 0
+    t0 = time.perf_counter()
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize, dtype=str):
+        read += len(chunk)
+        df = normalize(chunk, schema)
+        skipped += len(chunk) - len(df)
+        if df.empty:
+            continue
+
+        listings = list(df[["location", "sqft", "bath", "bhk"]].itertuples(index=False, name=None))
+        # scored by the city's own model when the registry has one
+        preds, versions = predict_versioned(listings, city)
+
+        rows = []
+        for (location, sqft, bath, bhk), listed_price, pred, version in zip(listings, df["listed_price"], preds, versions):
+            rows.append((location, sqft, bath, bhk, listed_price, None, city)
+                        + score_listing(listed_price, pred, sqft, bath, bhk) + (version, source))
+
+        with conn:
+            conn.executemany("""
+                INSERT INTO properties (location, sqft, bath, bhk, listed_price, image, city,
+                                        predicted_price, deal_rating, investment_score, risk_score, model_version,
+                                        source)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+        elapsed = time.perf_counter() - t0
+        print(f"  {city}: {read - skipped} rows imported ({read / elapsed:,.0f} rows/s)", file=sys.stderr)
+
+    elapsed = time.perf_counter() - t0
+    return {"file": path, "city": city, "read": read, "imported": read - skipped,
+            "skipped": skipped, "seconds": round(elapsed, 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import raw city CSV datasets into properties")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--city", choices=sorted(CITY_SCHEMAS), help="skip header-based detection")
+    parser.add_argument("--chunksize", type=int, default=50000)
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    migrate(conn)
+
+    for path in args.files:
+        r = import_file(conn, path, args.city, args.chunksize)
+        rate = r["read"] / r["seconds"] if r["seconds"] else 0
+        print(f"✅ {r['file']}: {r['imported']} imported, {r['skipped']} skipped "
+              f"in {r['seconds']}s ({rate:,.0f} rows/s)")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import os
+import io
+import time
+import pstats
+import cProfile
+import sqlite3
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+# In-process latency histograms, exported at /metrics in Prometheus text format.
+# Every request is timed per endpoint, and time spent inside it is split into
+# stages: db (queries + fetches), predict, score, comparables, charts, images and template.
+#
+# Everything is per process, so every sample carries a pid label: under gunicorn each
+# scrape lands on one worker, and sum without (pid) gives the service-wide figure.
+#
+# PROFILE_SLOW_MS=500 turns on per-request cProfile; requests slower than that
+# dump their stats to PROFILE_DIR/<endpoint>-<timestamp>.prof (plus a .txt summary).
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", 0))  # 0 = profiling off
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+_lock = threading.Lock()
+_histograms = {}  # (metric name, labels tuple) -> Histogram
+_counters = {}
+_local = threading.local()
+
+
+def current_endpoint():
+    # request threads set this in before_request; the batcher and CLI jobs don't
+    return getattr(_local, "endpoint", None) or "background"
+
+
+def observe(name, labels, seconds):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = Histogram()
+        h.observe(seconds)
+
+
+def inc(name, labels, n=1):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+
+def observe_stage(stage, seconds):
+    observe("valuestate_stage_seconds", {"stage": stage, "endpoint": current_endpoint()}, seconds)
+
+
+@contextmanager
+def timer(stage):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - t0)
+
+
+def timed(stage):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ---- SQLite ----
+# db.connect() uses this factory, so every execute and fetch lands in the "db" stage
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, *args):
+        with timer("db"):
+            return super().execute(*args)
+
+    def executemany(self, *args):
+        with timer("db"):
+            return super().executemany(*args)
+
+    def fetchone(self):
+        with timer("db"):
+            return super().fetchone()
+
+    def fetchmany(self, *args):
+        with timer("db"):
+            return super().fetchmany(*args)
+
+    def fetchall(self):
+        with timer("db"):
+            return super().fetchall()
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute builds a plain Cursor internally; route it through ours
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+
+# ---- Export ----
+
+def format_labels(labels):
+    return ",".join(f'{k}="{v}"' for k, v in labels)
+
+
+def sample(name, labels, value):
+    return f"{name}{{{format_labels(labels)}}} {value}" if labels else f"{name} {value}"
+
+
+def render(gauges=()):
+    # gauges: [(name, {label: value}, value), ...] computed by the caller at scrape time
+    lines = []
+    with _lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+    worker = (("pid", os.getpid()),)
+
+    seen = set()
+    for (name, labels), h in histograms:
+        labels += worker
+        if name not in seen:
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        cumulative = 0
+        for bound, n in zip(h.buckets + ("+Inf",), h.counts):
+            cumulative += n
+            le = format_labels(labels + (("le", bound),))
+            lines.append(f"{name}_bucket{{{le}}} {cumulative}")
+        lines.append(sample(f"{name}_sum", labels, f"{h.sum:.6f}"))
+        lines.append(sample(f"{name}_count", labels, h.count))
+
+    for (name, labels), n in counters:
+        labels += worker
+        if name not in seen:
+            lines.append(f"# TYPE {name} counter")
+            seen.add(name)
+        lines.append(sample(name, labels, n))
+
+    for name, labels, value in gauges:
+        if name not in seen:
+            lines.append(f"# TYPE {name} gauge")
+            seen.add(name)
+        lines.append(sample(name, tuple(sorted(labels.items())) + worker, value))
+
+    return "\n".join(lines) + "\n"
+
+
+# ---- Flask hooks ----
+
+# one cProfile at a time; concurrent requests just aren't profiled
+_profile_lock = threading.Lock()
+
+
+def dump_profile(profile, endpoint, seconds):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, f"{endpoint}-{time.strftime('%Y%m%d-%H%M%S')}-{int(seconds * 1000)}ms")
+    profile.dump_stats(base + ".prof")
+    out = io.StringIO()
+    pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(40)
+    with open(base + ".txt", "w") as f:
+        f.write(out.getvalue())
+
+
+def init_app(app):
+    from flask import g, request
+
+    @app.before_request
+    def start_timer():
+        _local.endpoint = request.endpoint or "unknown"
+        g.request_started = time.perf_counter()
+        if PROFILE_SLOW_MS and _profile_lock.acquire(blocking=False):
+            g.profile = cProfile.Profile()
+            g.profile.enable()
+
+    @app.after_request
+    def record_request(response):
+        endpoint = current_endpoint()
+        inc("valuestate_requests_total", {"endpoint": endpoint, "status": response.status_code})
+        return response
+
+    @app.teardown_request
+    def stop_timer(exc=None):
+        endpoint = current_endpoint()
+        started = g.pop("request_started", None)
+        if started is not None:
+            seconds = time.perf_counter() - started
+            observe("valuestate_request_seconds", {"endpoint": endpoint}, seconds)
+            profile = g.pop("profile", None)
+            if profile is not None:
+                profile.disable()
+                _profile_lock.release()
+                if seconds * 1000 >= PROFILE_SLOW_MS:
+                    dump_profile(profile, endpoint, seconds)
+        _local.endpoint = None
+
+    from flask import template_rendered, before_render_template
+
+    # template_rendered fires after the render finishes, so bracket it with both signals
+    def template_started(sender, template, context, **extra):
+        g.template_started = time.perf_counter()
+
+    def template_finished(sender, template, context, **extra):
+        started = g.pop("template_started", None)
+        if started is not None:
+            observe_stage("template", time.perf_counter() - started)
+
+    # weak=False: blinker would otherwise drop these closures once init_app returns
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
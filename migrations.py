@@ -0,0 +1,311 @@
+import os
+import sqlite3
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get("VALUESTATE_DB", os.path.join(BASE_DIR, "database.db"))
+
+# Schema changes are applied in order and tracked with PRAGMA user_version.
+# Each step must be safe on databases created before the runner existed
+# (IF NOT EXISTS / column checks), since those all start at user_version 0.
+
+
+def add_column(conn, table, name, sql_type):
+    existing = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+    if name not in existing:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+
+
+def m001_initial_schema(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS properties (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        location TEXT NOT NULL,
+        sqft REAL NOT NULL,
+        bath INTEGER NOT NULL,
+        bhk INTEGER NOT NULL,
+        listed_price REAL NOT NULL,
+        image TEXT
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS inquiries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        property_id INTEGER,
+        name TEXT,
+        phone TEXT,
+        message TEXT
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS price_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        property_id INTEGER NOT NULL,
+        old_price REAL NOT NULL,
+        new_price REAL NOT NULL,
+        changed_at TEXT NOT NULL
+    )
+    """)
+
+
+def m002_valuation_columns(conn):
+    # Persisted model output + derived scores (see valuation.cached_valuations)
+    add_column(conn, "properties", "predicted_price", "REAL")
+    add_column(conn, "properties", "deal_rating", "TEXT")
+    add_column(conn, "properties", "investment_score", "INTEGER")
+    add_column(conn, "properties", "risk_score", "INTEGER")
+    add_column(conn, "properties", "model_version", "TEXT")
+    # "Best Deals" sort and deal-rating filter on the home page
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_properties_score ON properties (investment_score DESC, id DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_properties_rating ON properties (deal_rating, investment_score DESC, id DESC)")
+
+
+def m003_hot_path_indexes(conn):
+    # home(): location / bhk equality plus listed_price range or sort
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_properties_location_price ON properties (location, listed_price)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_properties_bhk_price ON properties (bhk, listed_price)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_properties_price ON properties (listed_price)")
+    # admin_inquiries() join and per-property lookups
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_inquiries_property ON inquiries (property_id)")
+    # property(): history for one listing in insertion order
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_price_history_property ON price_history (property_id, id)")
+    conn.execute("ANALYZE")
+
+
+def m004_location_search(conn):
+    # Trigram FTS5 index over location so the home search's substring match can use an index.
+    # External-content table: the text lives in properties, triggers keep the index in sync.
+    try:
+        conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS properties_fts
+        USING fts5(location, content='properties', content_rowid='id', tokenize='trigram')
+        """)
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5 / trigram (< 3.34): home() keeps using LIKE
+        return
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS properties_fts_insert AFTER INSERT ON properties BEGIN
+        INSERT INTO properties_fts (rowid, location) VALUES (new.id, new.location);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS properties_fts_delete AFTER DELETE ON properties BEGIN
+        INSERT INTO properties_fts (properties_fts, rowid, location) VALUES ('delete', old.id, old.location);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS properties_fts_update AFTER UPDATE OF location ON properties BEGIN
+        INSERT INTO properties_fts (properties_fts, rowid, location) VALUES ('delete', old.id, old.location);
+        INSERT INTO properties_fts (rowid, location) VALUES (new.id, new.location);
+    END
+    """)
+    conn.execute("INSERT INTO properties_fts (properties_fts) VALUES ('rebuild')")
+
+
+def m005_data_version(conn):
+    # Monotonic counter bumped whenever listing data changes; chart caches key on it
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    """)
+    conn.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+    for name, event in [
+        ("insert", "AFTER INSERT ON properties"),
+        ("delete", "AFTER DELETE ON properties"),
+        ("update", "AFTER UPDATE OF location, sqft, bath, bhk, listed_price ON properties"),
+    ]:
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS properties_data_version_{name} {event} BEGIN
+            UPDATE data_version SET version = version + 1 WHERE id = 1;
+        END
+        """)
+
+
+def recommendation_flags(row):
+    # SQL mirror of valuation.price_recommendation -> (under, fair, over) as 0/1; unscored rows count in none
+    pct = f"(({row}.listed_price - {row}.predicted_price) / {row}.predicted_price) * 100"
+    scored = f"{row}.predicted_price > 0"
+    return (
+        f"COALESCE({scored} AND {pct} < -10, 0)",
+        f"COALESCE({scored} AND {pct} >= -10 AND {pct} <= 10, 0)",
+        f"COALESCE({scored} AND {pct} > 10, 0)",
+    )
+
+
+def m006_summary_stats(conn):
+    # Running per-location / per-BHK aggregates for dashboard() and analytics(),
+    # maintained by triggers so every writer (routes, bulk scripts, rescoring) keeps them exact
+    for table, key, key_type in [("location_stats", "location", "TEXT"), ("bhk_stats", "bhk", "INTEGER")]:
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            {key} {key_type} PRIMARY KEY,
+            listing_count INTEGER NOT NULL DEFAULT 0,
+            price_sum REAL NOT NULL DEFAULT 0,
+            under INTEGER NOT NULL DEFAULT 0,
+            fair INTEGER NOT NULL DEFAULT 0,
+            over INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+
+        add_u, add_f, add_o = recommendation_flags("new")
+        sub_u, sub_f, sub_o = recommendation_flags("old")
+        add = f"""
+            INSERT INTO {table} ({key}, listing_count, price_sum, under, fair, over)
+            VALUES (new.{key}, 1, new.listed_price, {add_u}, {add_f}, {add_o})
+            ON CONFLICT ({key}) DO UPDATE SET
+                listing_count = listing_count + 1,
+                price_sum = price_sum + excluded.price_sum,
+                under = under + excluded.under,
+                fair = fair + excluded.fair,
+                over = over + excluded.over;
+        """
+        sub = f"""
+            UPDATE {table} SET
+                listing_count = listing_count - 1,
+                price_sum = price_sum - old.listed_price,
+                under = under - {sub_u},
+                fair = fair - {sub_f},
+                over = over - {sub_o}
+            WHERE {key} = old.{key};
+        """
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON properties BEGIN {add} END")
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON properties BEGIN {sub} END")
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_update
+        AFTER UPDATE OF location, bhk, listed_price, predicted_price ON properties BEGIN {sub} {add} END
+        """)
+
+        # backfill from whatever is already there
+        u, f, o = recommendation_flags("p")
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"""
+            INSERT INTO {table} ({key}, listing_count, price_sum, under, fair, over)
+            SELECT {key}, COUNT(*), SUM(listed_price), SUM({u}), SUM({f}), SUM({o})
+            FROM properties p GROUP BY {key}
+        """)
+
+
+def m007_city(conn):
+    # Listings imported from the Bangalore / Delhi datasets; everything before this was Pune
+    add_column(conn, "properties", "city", "TEXT NOT NULL DEFAULT 'Pune'")
+
+
+def m008_price_history_ts(conn):
+    # Numeric change time (unix seconds) so history windows are integer range scans;
+    # changed_at stays as the local-time text it always was
+    add_column(conn, "price_history", "changed_ts", "INTEGER")
+    conn.execute("""
+        UPDATE price_history SET changed_ts = CAST(strftime('%s', changed_at, 'utc') AS INTEGER)
+        WHERE changed_ts IS NULL
+    """)
+    # writers that only set changed_at (bulk scripts, older code) still get a timestamp
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS price_history_changed_ts AFTER INSERT ON price_history
+    WHEN new.changed_ts IS NULL BEGIN
+        UPDATE price_history SET changed_ts = CAST(strftime('%s', new.changed_at, 'utc') AS INTEGER)
+        WHERE id = new.id;
+    END
+    """)
+    # (property_id, changed_ts) also covers the old per-property lookups, so it replaces that index
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_price_history_property_ts ON price_history (property_id, changed_ts)")
+    conn.execute("DROP INDEX IF EXISTS idx_price_history_property")
+
+
+def m009_risk_scan(conn):
+    # Results of the catalog-wide risk / anomaly scan (scan.py), one row per scored listing.
+    # anomaly_mask holds valuation.ANOMALY_FLAGS as bits.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS risk_scan (
+        property_id INTEGER PRIMARY KEY,
+        risk_score INTEGER NOT NULL,
+        risk_level TEXT NOT NULL,
+        anomaly_mask INTEGER NOT NULL,
+        deal_rating TEXT NOT NULL,
+        investment_score INTEGER NOT NULL,
+        scanned_at INTEGER NOT NULL
+    )
+    """)
+    # "all High-risk listings, riskiest first", keyset-paged on (risk_score, property_id)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_risk_scan_level ON risk_scan (risk_level, risk_score DESC, property_id DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_risk_scan_score ON risk_scan (risk_score DESC, property_id DESC)")
+
+
+def m010_data_version_scores(conn):
+    # Rescoring (model swaps, rescore.py, lazy refresh) rewrites predicted_price, which moves
+    # the under / fair / over buckets in location_stats / bhk_stats; bump data_version so
+    # the dashboard and analytics caches rebuild from them
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS properties_data_version_scores
+    AFTER UPDATE OF predicted_price ON properties
+    WHEN old.predicted_price IS NOT new.predicted_price BEGIN
+        UPDATE data_version SET version = version + 1 WHERE id = 1;
+    END
+    """)
+
+
+def m011_property_source(conn):
+    # Dataset file a listing was imported from (import_csv.py); NULL for listings posted in the app.
+    # train.py uses it to keep imported copies of its own training CSVs out of the DB rows.
+    add_column(conn, "properties", "source", "TEXT")
+
+
+def m012_model_swap_claim(conn):
+    # One row: the set of model versions whose catalog rescore some process has taken on.
+    # Every web worker notices a model swap; only the one that moves this row does the rescore.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS model_swap (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        versions TEXT,
+        pid INTEGER,
+        claimed_at INTEGER
+    )
+    """)
+    conn.execute("INSERT OR IGNORE INTO model_swap (id) VALUES (1)")
+
+
+MIGRATIONS = [
+    (1, m001_initial_schema),
+    (2, m002_valuation_columns),
+    (3, m003_hot_path_indexes),
+    (4, m004_location_search),
+    (5, m005_data_version),
+    (6, m006_summary_stats),
+    (7, m007_city),
+    (8, m008_price_history_ts),
+    (9, m009_risk_scan),
+    (10, m010_data_version_scores),
+    (11, m011_property_source),
+    (12, m012_model_swap_claim),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target=None):
+    # Apply every pending migration up to target (default: latest); returns the applied versions
+    target = LATEST_VERSION if target is None else target
+    current = schema_version(conn)
+    applied = []
+    for version, step in MIGRATIONS:
+        if current < version <= target:
+            with conn:
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+            applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    conn = sqlite3.connect(DB_PATH)
+    applied = migrate(conn)
+    print(f"✅ Schema at version {schema_version(conn)} (applied: {applied or 'none'})")
+    conn.close()
@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from migrations import DB_PATH, migrate
+from valuation import active_models, score_rows, stale_clause, store_valuations
+
+# Full-catalog rescoring after a model retrain, sharded by id range across processes.
+#   python rescore.py              # only rows scored by an older model
+#   python rescore.py --all -j 8   # everything, 8 workers
+# Workers only read and score; the parent is the single writer, so shards never
+# contend for SQLite's write lock. Each listing is scored by its city's model.
+
+_worker_db = None
+
+
+def init_worker(db_path):
+    global _worker_db
+    _worker_db = sqlite3.connect(db_path)
+    _worker_db.row_factory = sqlite3.Row
+
+
+def score_shard(lo, hi, only_stale, batch_size):
+    # Score ids in [lo, hi) -> [(predicted_price, deal_rating, investment_score, risk_score, model_version, id), ...]
+    sql = "SELECT id, location, sqft, bath, bhk, listed_price, city FROM properties WHERE id >= ? AND id < ?"
+    stale_params = []
+    if only_stale:
+        stale, stale_params = stale_clause()
+        sql += " AND " + stale
+    sql += " ORDER BY id LIMIT ?"
+
+    out = []
+    last = lo
+    while True:
+        rows = _worker_db.execute(sql, [last, hi] + stale_params + [batch_size]).fetchall()
+        if not rows:
+            break
+        out.extend(s + (p["id"],) for p, s in zip(rows, score_rows(rows)))
+        last = rows[-1]["id"] + 1
+    return out
+
+
+def shards(conn, shard_size):
+    lo, hi = conn.execute("SELECT MIN(id), MAX(id) FROM properties").fetchone()
+    if lo is None:
+        return []
+    return [(start, min(start + shard_size, hi + 1)) for start in range(lo, hi + 1, shard_size)]
+
+
+def rescore(db_path=DB_PATH, workers=None, only_stale=True, shard_size=50000, batch_size=5000):
+    conn = sqlite3.connect(db_path)
+    migrate(conn)
+    work = shards(conn, shard_size)
+    workers = workers or os.cpu_count() or 1
+
+    # Models load lazily, so load them here, before the pool starts: forked workers then
+    # share the parent's model pages instead of each deserializing its own copy
+    for m in active_models().values():
+        m.get_model()
+        m.get_forest()
+
+    done = 0
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(db_path,)) as pool:
+        futures = [pool.submit(score_shard, lo, hi, only_stale, batch_size) for lo, hi in work]
+        for i, fut in enumerate(as_completed(futures), 1):
+            updates = fut.result()
+            with conn:
+                store_valuations(conn, updates)
+            done += len(updates)
+            elapsed = time.perf_counter() - t0
+            print(f"  shard {i}/{len(work)}: {done} rows ({done / elapsed:,.0f} rows/s)", file=sys.stderr)
+
+    conn.close()
+    return done, time.perf_counter() - t0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rescore the property catalog with the deployed model")
+    parser.add_argument("--all", action="store_true", help="rescore every row, not just stale ones")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="default: one per core")
+    parser.add_argument("--shard-size", type=int, default=50000, help="ids per shard")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per predict call")
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args(argv)
+
+    n, seconds = rescore(args.db, args.workers, not args.all, args.shard_size, args.batch_size)
+    rate = n / seconds if seconds else 0
+    print(f"✅ Rescored {n} properties in {seconds:.1f}s ({rate:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from migrations import BASE_DIR, DB_PATH, migrate
+from import_csv import CITY_SCHEMAS, detect_city, normalize
+
+# Scripted retraining, replacing the notebook run.
+#   python train.py --city Pune                  # data/*.csv for Pune + Pune rows in database.db
+#   python train.py --city Bangalore --activate  # ...and point model/registry.json at the result
+#
+# Sources are streamed in chunks into compact arrays (location id, sqft, bath, bhk, price)
+# and cleaned the way notebooks/model_training.ipynb did. The parsed CSVs are cached under
+# model/cache keyed by the files' stamps, so a rerun only re-reads the database rows.
+# Listings that import_csv.py copied from one of the CSVs in use are skipped, so no listing
+# is counted twice (or lands on both sides of the test split). The grid search runs across
+# all cores. Each run writes model/<city>/<version>/ with the model, its column schema, a
+# flat-forest export and metadata.json.
+
+MODELS_DIR = os.path.join(BASE_DIR, "model")
+CACHE_DIR = os.path.join(MODELS_DIR, "cache")
+DATA_DIR = os.path.join(BASE_DIR, "data")
+
+# Only what the app can fill in at prediction time (valuation.CityModel): the training
+# notebook also used balcony and area_type, which are always 0 when serving.
+NUMERIC = ["total_sqft", "bath", "bhk"]
+LOCATION_PREFIX = "site_location_"
+
+# Locations with fewer listings get no column of their own, like unknown names at serving time
+MIN_LOCATION_COUNT = 10
+MIN_SQFT_PER_BHK = 300
+PARSE_VERSION = 2  # bump when the CSV parsing changes so cached arrays are rebuilt
+
+PARAM_GRID = {
+    "n_estimators": [200, 300],
+    "max_depth": [None, 20, 30],
+    "min_samples_split": [2, 5],
+    "min_samples_leaf": [1, 2],
+}
+QUICK_GRID = {"n_estimators": [100], "max_depth": [None, 20], "min_samples_split": [2], "min_samples_leaf": [1, 2]}
+
+
+def csv_sources(city, paths=None):
+    paths = paths or sorted(glob.glob(os.path.join(DATA_DIR, "*.csv")))
+    return [p for p in paths if detect_city(p) == city]
+
+
+def read_csv(path, city, chunksize):
+    schema = CITY_SCHEMAS[city]
+    usecols = [schema[k] for k in ("location", "bhk", "sqft", "bath", "price")]
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize, dtype=str):
+        df = normalize(chunk, schema)
+        yield df[["location", "sqft", "bath", "bhk", "listed_price"]].itertuples(index=False, name=None)
+
+
+def read_db(conn, city, chunksize, exclude_sources=()):
+    # the city's listings, minus copies imported from exclude_sources (properties.source)
+    exclude_sources = sorted(exclude_sources)
+    skip = f"AND (source IS NULL OR source NOT IN ({', '.join('?' for _ in exclude_sources)}))" if exclude_sources else ""
+    last = 0
+    while True:
+        rows = conn.execute(f"""
+            SELECT id, location, sqft, bath, bhk, listed_price FROM properties
+            WHERE city = ? AND id > ? {skip} ORDER BY id LIMIT ?
+        """, [city, last] + exclude_sources + [chunksize]).fetchall()
+        if not rows:
+            return
+        last = rows[-1][0]
+        yield (r[1:] for r in rows)
+
+
+def collect(chunks, names=()):
+    # stream of (location, sqft, bath, bhk, price) chunks -> location vocabulary + compact arrays;
+    # names seeds the vocabulary so ids line up with arrays collected earlier
+    vocab = {name: i for i, name in enumerate(names)}
+    loc, sqft, bath, bhk, price = [], [], [], [], []
+    for chunk in chunks:
+        for location, s, b, k, p in chunk:
+            loc.append(vocab.setdefault(location.strip(), len(vocab)))
+            sqft.append(s)
+            bath.append(b)
+            bhk.append(k)
+            price.append(p)
+    names = sorted(vocab, key=vocab.get)
+    return names, {
+        "loc": np.asarray(loc, dtype=np.int32),
+        "sqft": np.asarray(sqft, dtype=np.float64),
+        "bath": np.asarray(bath, dtype=np.float64),
+        "bhk": np.asarray(bhk, dtype=np.float64),
+        "price": np.asarray(price, dtype=np.float64),
+    }
+
+
+def clean(names, data):
+    # notebook rules: drop < MIN_SQFT_PER_BHK sqft per bedroom, keep each location's
+    # price-per-sqft within one standard deviation, fold rare locations into "no column"
+    keep = data["sqft"] / data["bhk"] >= MIN_SQFT_PER_BHK
+    pps = data["price"] * 100000 / data["sqft"]
+    loc = data["loc"]
+    counts = np.bincount(loc, minlength=len(names))
+    sums = np.bincount(loc, weights=pps, minlength=len(names))
+    squares = np.bincount(loc, weights=pps * pps, minlength=len(names))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums / counts
+        std = np.sqrt(np.maximum(squares / counts - mean * mean, 0))
+    keep &= (pps > mean[loc] - std[loc]) & (pps <= mean[loc] + std[loc])
+    data = {k: v[keep] for k, v in data.items()}
+
+    # re-count after filtering; frequent locations get dense ids 0..n-1, the rest -1
+    counts = np.bincount(data["loc"], minlength=len(names))
+    frequent = sorted(i for i, n in enumerate(counts) if n >= MIN_LOCATION_COUNT)
+    remap = np.full(len(names) + 1, -1, dtype=np.int32)
+    remap[frequent] = np.arange(len(frequent), dtype=np.int32)
+    data["loc"] = remap[data["loc"]]
+    return [names[i] for i in frequent], data
+
+
+def stamp(path):
+    st = os.stat(path)
+    return [os.path.relpath(path, BASE_DIR), st.st_size, st.st_mtime_ns]
+
+
+def load_csv_rows(city, csv_paths, chunksize, refresh=False):
+    # parsed (not yet cleaned) CSV arrays, cached by the files' stamps -> (names, data, cache_key)
+    key_src = {"city": city, "csv": [stamp(p) for p in csv_paths], "parse": PARSE_VERSION}
+    key = hashlib.sha1(json.dumps(key_src, sort_keys=True).encode()).hexdigest()[:16]
+    path = os.path.join(CACHE_DIR, f"{city.lower()}-csv-{key}.npz")
+
+    if not refresh and os.path.exists(path):
+        cached = np.load(path, allow_pickle=False)
+        data = {k: cached[k] for k in ("loc", "sqft", "bath", "bhk", "price")}
+        print(f"  csv: cache hit {os.path.relpath(path, BASE_DIR)}", file=sys.stderr)
+        return [str(s) for s in cached["names"]], data, key
+
+    def chunks():
+        for p in csv_paths:
+            yield from read_csv(p, city, chunksize)
+
+    t0 = time.perf_counter()
+    names, data = collect(chunks())
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, names=np.asarray(names, dtype=str), **data)
+    os.replace(tmp, path)
+    print(f"  csv: parsed {len(data['price'])} rows in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    return names, data, key
+
+
+def load_features(city, csv_paths, conn, chunksize, refresh=False):
+    # cleaned training rows from the CSVs plus the city's database listings -> (locations, data, csv cache key)
+    names, data, key = load_csv_rows(city, csv_paths, chunksize, refresh)
+    if conn is not None:
+        t0 = time.perf_counter()
+        sources = {os.path.basename(p) for p in csv_paths}
+        names, db_data = collect(read_db(conn, city, chunksize, sources), names)
+        data = {k: np.concatenate([data[k], db_data[k]]) for k in data}
+        print(f"  db: {len(db_data['price'])} listings in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    return clean(names, data) + (key,)
+
+
+def feature_matrix(locations, data):
+    # same layout valuation.CityModel expects: numeric columns, then one site_location_* per location
+    columns = pd.Index(NUMERIC + [LOCATION_PREFIX + name for name in locations])
+    n = len(data["price"])
+    x = np.zeros((n, len(columns)), dtype=np.float32)
+    x[:, 0] = data["sqft"]
+    x[:, 1] = data["bath"]
+    x[:, 2] = data["bhk"]
+    known = data["loc"] >= 0
+    x[np.nonzero(known)[0], len(NUMERIC) + data["loc"][known]] = 1
+    return columns, x
+
+
+def search(x, y, grid, jobs, seed):
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.model_selection import GridSearchCV, train_test_split
+    from sklearn.metrics import mean_absolute_error
+
+    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.2, random_state=seed)
+    # parallelism is across candidates/folds, so each forest itself is single-threaded
+    gs = GridSearchCV(RandomForestRegressor(random_state=seed, n_jobs=1), grid, cv=3, n_jobs=jobs, verbose=1)
+    gs.fit(x_train, y_train)
+    best = gs.best_estimator_
+    pred = best.predict(x_test)
+    return best, {
+        "params": gs.best_params_,
+        "cv_r2": round(float(gs.best_score_), 4),
+        "test_r2": round(float(best.score(x_test, y_test)), 4),
+        "test_mae": round(float(mean_absolute_error(y_test, pred)), 4),
+        "train_rows": len(y_train),
+        "test_rows": len(y_test),
+    }
+
+
+def write_atomic_json(path, obj):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f, indent=2)
+    os.replace(tmp, path)
+
+
+def save_artifacts(city, model, columns, metadata):
+    import forest
+    from valuation import file_hash
+
+    version = time.strftime("%Y%m%d-%H%M%S")
+    rel = f"{city.lower()}/{version}"
+    out = os.path.join(MODELS_DIR, rel)
+    os.makedirs(out)
+    model_path = os.path.join(out, "model.pkl")
+    # uncompressed, so the app can mmap it
+    joblib.dump(model, model_path)
+    joblib.dump(columns, os.path.join(out, "model_columns.pkl"))
+    forest.export(model, columns, os.path.join(out, "model.forest.joblib"), file_hash(model_path))
+    write_atomic_json(os.path.join(out, "metadata.json"), dict(metadata, version=version, model_hash=file_hash(model_path)))
+    return rel
+
+
+def activate(city, rel):
+    # the app's registry check picks this up without a restart
+    from valuation import REGISTRY_PATH
+    try:
+        with open(REGISTRY_PATH) as f:
+            registry = json.load(f)
+    except FileNotFoundError:
+        registry = {}
+    registry[city] = rel
+    write_atomic_json(REGISTRY_PATH, registry)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train a versioned price model for one city")
+    parser.add_argument("--city", default="Pune", choices=sorted(CITY_SCHEMAS))
+    parser.add_argument("--csv", nargs="*", help="raw datasets (default: every data/*.csv for the city)")
+    parser.add_argument("--db", default=DB_PATH, help="also learn from this database's listings")
+    parser.add_argument("--no-db", action="store_true", help="raw datasets only")
+    parser.add_argument("--chunksize", type=int, default=50000)
+    parser.add_argument("--refresh-features", action="store_true", help="ignore the feature cache")
+    parser.add_argument("--quick", action="store_true", help="small grid for a fast sanity run")
+    parser.add_argument("-j", "--jobs", type=int, default=-1, help="parallel fits (default: all cores)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--activate", action="store_true", help="point model/registry.json at the new model")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    csv_paths = csv_sources(args.city, args.csv)
+    conn = None
+    if not args.no_db:
+        conn = sqlite3.connect(args.db)
+        migrate(conn)
+
+    locations, data, feature_key = load_features(args.city, csv_paths, conn, args.chunksize, args.refresh_features)
+    if conn is not None:
+        conn.close()
+    if len(data["price"]) < 100:
+        sys.exit(f"❌ only {len(data['price'])} usable rows for {args.city}")
+
+    columns, x = feature_matrix(locations, data)
+    t_search = time.perf_counter()
+    model, scores = search(x, data["price"], QUICK_GRID if args.quick else PARAM_GRID, args.jobs, args.seed)
+
+    metadata = dict(
+        scores,
+        city=args.city,
+        created_at=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        sources=[os.path.relpath(p, BASE_DIR) for p in csv_paths] + ([] if args.no_db else ["properties"]),
+        csv_cache=feature_key,
+        rows=len(data["price"]),
+        columns=len(columns),
+        seed=args.seed,
+        search_s=round(time.perf_counter() - t_search, 1),
+    )
+    rel = save_artifacts(args.city, model, columns, metadata)
+    if args.activate:
+        activate(args.city, rel)
+
+    print(f"✅ {args.city} model model/{rel}: test R² {scores['test_r2']}, MAE {scores['test_mae']} lakhs, "
+          f"{metadata['rows']} rows, {time.perf_counter() - t0:.0f}s"
+          + (" (active)" if args.activate else ""))
+
+
+if __name__ == "__main__":
+    main()
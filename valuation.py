@@ -0,0 +1,900 @@
+import os
+import sys
+import json
+import argparse
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import wraps
+import joblib
+import numpy as np
+import pandas as pd
+
+from metrics import timed, timer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, "model", "pune_house_price_model.pkl")
+COLUMNS_PATH = os.path.join(BASE_DIR, "model", "model_columns.pkl")
+# flat NumPy export of the forest, written by `python forest.py`
+FOREST_PATH = os.path.join(BASE_DIR, "model", "pune_house_price_model.forest.joblib")
+
+LOCATION_PREFIX = "site_location_"
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+# ---- In-process valuation cache ----
+# Many listings share a (location, sqft, bath, bhk) tuple and hot pages get reloaded constantly
+
+CACHE_SIZE = int(os.environ.get("VALUATION_CACHE_SIZE", 50000))
+CACHE_TTL = float(os.environ.get("VALUATION_CACHE_TTL", 3600))  # seconds, 0 = no expiry
+
+
+class LRUCache:
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, stored_at = item
+                if not self.ttl or time.monotonic() - stored_at < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+_MISSING = object()
+_caches = {}
+
+
+def memoize(fn):
+    cache = _caches[fn.__name__] = LRUCache()
+
+    @wraps(fn)
+    def wrapper(*args):
+        value = cache.get(args, _MISSING)
+        if value is _MISSING:
+            value = fn(*args)
+            cache.set(args, value)
+        # don't hand out the cached list itself
+        return list(value) if isinstance(value, list) else value
+
+    wrapper.cache = cache
+    return wrapper
+
+
+def cache_stats():
+    stats = {name: cache.stats() for name, cache in _caches.items()}
+    for city, m in _models.items():
+        stats[f"predict_price:{city}"] = m.cache.stats()
+    return stats
+
+
+def clear_caches():
+    for cache in _caches.values():
+        cache.clear()
+    for m in _models.values():
+        m.cache.clear()
+
+
+# ---- Model registry ----
+# One model per city, keyed by city and version. model/registry.json points each city
+# at a version directory holding model.pkl + model_columns.pkl (+ model.forest.joblib):
+#   {"Pune": "pune/20261017-093000", "Bangalore": "bangalore/20261017-101500"}
+# Pune falls back to the original model/pune_house_price_model.pkl files, and cities
+# without a model of their own are scored by DEFAULT_CITY's.
+#
+# Active models live in one dict that is replaced wholesale when registry.json or a
+# model file changes (checked every MODEL_RELOAD_INTERVAL seconds), so there's no restart.
+# Callers take a CityModel once and use it for the whole call, which means an in-flight
+# request finishes on the model it started with.
+
+MODELS_DIR = os.path.join(BASE_DIR, "model")
+REGISTRY_PATH = os.path.join(MODELS_DIR, "registry.json")
+DEFAULT_CITY = "Pune"
+MODEL_RELOAD_INTERVAL = float(os.environ.get("MODEL_RELOAD_INTERVAL", 5))  # seconds, 0 = never
+
+
+def file_stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class CityModel:
+    def __init__(self, city, model_path, columns_path, forest_path):
+        self.city = city
+        self.model_path = model_path
+        self.forest_path = forest_path
+        self.stamp = file_stamp(model_path)
+
+        # the forest itself is loaded lazily by get_model(); the schema is small and needed up front
+        self.columns = joblib.load(columns_path)
+        # Stored valuations are tagged with this; a new model file means new version
+        self.version = file_hash(model_path)
+        self._model = None
+        self._forest = None
+        self._lock = threading.Lock()
+        self.cache = LRUCache()
+
+        # Column positions are fixed by the training schema, so resolve them once
+        self.sqft_col = self.columns.get_loc("total_sqft")
+        self.bath_col = self.columns.get_loc("bath")
+        self.bhk_col = self.columns.get_loc("bhk")
+        self.location_index = {
+            c[len(LOCATION_PREFIX):]: i for i, c in enumerate(self.columns) if c.startswith(LOCATION_PREFIX)
+        }
+        # Location vocabulary: name -> small integer id -> feature column. Listings are encoded
+        # with the id once; the trailing -1 makes id -1 (unknown location) map to "no column".
+        self.locations = tuple(sorted(self.location_index))
+        self.location_ids = {name: i for i, name in enumerate(self.locations)}
+        self.location_cols = np.array([self.location_index[n] for n in self.locations] + [-1], dtype=np.int32)
+
+    def get_model(self):
+        # Deserialized on first prediction, not at import: processes that only serve
+        # stored valuations never pay for it. mmap_mode lets joblib map the pickle's
+        # array buffers from the page cache instead of reading them onto the heap.
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = joblib.load(self.model_path, mmap_mode="r")
+        return self._model
+
+    def get_forest(self):
+        # Flat NumPy engine (forest.py) if an export for this model exists, else None
+        if self._forest is None:
+            import forest as flat
+            with self._lock:
+                if self._forest is None:
+                    self._forest = flat.load(self.forest_path, self.version) or False
+        return self._forest or None
+
+    def cache_key(self, location, sqft, bath, bhk):
+        # the model input for one listing; every unknown location encodes to -1 and shares entries
+        return (self.location_ids.get(location, -1), float(sqft), int(bath), int(bhk))
+
+    def build_features(self, keys):
+        # keys: sequence of encoded (location id, sqft, bath, bhk) -> one preallocated one-hot matrix
+        n = len(keys)
+        x = np.zeros((n, len(self.columns)), dtype=np.float64)
+        if n == 0:
+            return x
+
+        x[:, self.sqft_col] = [k[1] for k in keys]
+        x[:, self.bath_col] = [k[2] for k in keys]
+        x[:, self.bhk_col] = [k[3] for k in keys]
+
+        loc_idx = self.location_cols[np.fromiter((k[0] for k in keys), dtype=np.int32, count=n)]
+        known = loc_idx >= 0
+        x[np.nonzero(known)[0], loc_idx[known]] = 1
+        return x
+
+    def sparse_features(self, keys):
+        # encoded keys -> (location column index or -1, sqft, bath, bhk) arrays for the flat forest
+        n = len(keys)
+        return (
+            self.location_cols[np.fromiter((k[0] for k in keys), dtype=np.int32, count=n)],
+            np.fromiter((k[1] for k in keys), dtype=np.float64, count=n),
+            np.fromiter((k[2] for k in keys), dtype=np.float64, count=n),
+            np.fromiter((k[3] for k in keys), dtype=np.float64, count=n),
+        )
+
+    def predict_uncached(self, keys):
+        flat = self.get_forest()
+        if flat is not None:
+            return flat.predict(*self.sparse_features(keys))
+        x = pd.DataFrame(self.build_features(keys), columns=self.columns)
+        return self.get_model().predict(x)
+
+
+def model_sources():
+    # city -> (model, columns, forest) paths, from registry.json plus the legacy Pune files
+    sources = {}
+    if os.path.exists(MODEL_PATH):
+        sources[DEFAULT_CITY] = (MODEL_PATH, COLUMNS_PATH, FOREST_PATH)
+    try:
+        with open(REGISTRY_PATH) as f:
+            registry = json.load(f)
+    except FileNotFoundError:
+        registry = {}
+    for city, version in registry.items():
+        d = os.path.join(MODELS_DIR, version)
+        sources[city] = (os.path.join(d, "model.pkl"), os.path.join(d, "model_columns.pkl"),
+                         os.path.join(d, "model.forest.joblib"))
+    return sources
+
+
+_registry_lock = threading.Lock()
+_models = {}
+_sources_stamp = None
+_last_check = 0.0
+_swap_listeners = []
+
+
+def on_model_swap(fn):
+    # fn(cities) runs after a reload that replaced (or dropped) those cities' models
+    _swap_listeners.append(fn)
+    return fn
+
+
+def sources_stamp(sources):
+    return (file_stamp(REGISTRY_PATH), tuple(sorted((c, p[0], file_stamp(p[0])) for c, p in sources.items())))
+
+
+def load_models():
+    # (Re)build the active model set; unchanged models (same file, same stamp) are kept with their caches
+    global _models, _sources_stamp, _last_check
+    with _registry_lock:
+        sources = model_sources()
+        stamp = sources_stamp(sources)
+        if stamp == _sources_stamp:
+            return _models
+        models = {}
+        for city, (model_path, columns_path, forest_path) in sources.items():
+            old = _models.get(city)
+            if old is not None and old.model_path == model_path and old.stamp == file_stamp(model_path):
+                models[city] = old
+            else:
+                models[city] = CityModel(city, model_path, columns_path, forest_path)
+        if DEFAULT_CITY not in models:
+            raise FileNotFoundError(f"no model for the default city {DEFAULT_CITY}")
+        previous = _models
+        _models = models  # one assignment: readers see the old set or the new one, never a mix
+        _sources_stamp = stamp
+        _last_check = time.monotonic()
+
+    changed = {c for c in set(previous) | set(models) if previous.get(c) is not models.get(c)}
+    if previous and changed:
+        for fn in _swap_listeners:
+            fn(changed)
+    return models
+
+
+def active_models():
+    global _last_check
+    if MODEL_RELOAD_INTERVAL and time.monotonic() - _last_check > MODEL_RELOAD_INTERVAL:
+        _last_check = time.monotonic()
+        if sources_stamp(model_sources()) != _sources_stamp:
+            load_models()
+    return _models
+
+
+def get_city_model(city=None):
+    models = active_models()
+    return models.get(city or DEFAULT_CITY) or models[DEFAULT_CITY]
+
+
+def model_version(city=None):
+    return get_city_model(city).version
+
+
+def model_versions():
+    return {city: m.version for city, m in active_models().items()}
+
+
+_all_locations = (None, [])
+
+
+def all_locations():
+    # union of every city model's location vocabulary, sorted; rebuilt only when the model set changes
+    global _all_locations
+    models = active_models()
+    if _all_locations[0] is not models:
+        names = set()
+        for m in models.values():
+            names.update(m.locations)
+        _all_locations = (models, sorted(names))
+    return _all_locations[1]
+
+
+def get_model(city=None):
+    return get_city_model(city).get_model()
+
+
+def get_forest(city=None):
+    return get_city_model(city).get_forest()
+
+
+def load_model():
+    # Re-read registry.json and the model files now instead of waiting for the next check
+    models = load_models()
+    # memoized scores don't depend on the model, but keep a reload a clean slate
+    clear_caches()
+    return models
+
+
+load_models()
+
+
+@timed("predict")
+def predict_keys(cm, keys):
+    # Score many encoded listings with a single model.predict call; cached keys skip the model
+    out = [cm.cache.get(k) for k in keys]
+
+    misses = [i for i, v in enumerate(out) if v is None]
+    if misses:
+        todo = list(OrderedDict.fromkeys(keys[i] for i in misses))
+        scored = dict(zip(todo, (float(v) for v in cm.predict_uncached(todo))))
+        for k, v in scored.items():
+            cm.cache.set(k, v)
+        for i in misses:
+            out[i] = scored[keys[i]]
+
+    return out
+
+
+def predict_versioned(rows, city=None):
+    # rows: (location, sqft, bath, bhk) or (location, sqft, bath, bhk, city), each routed to
+    # its city's model -> (prices, model versions)
+    groups = {}
+    for i, r in enumerate(rows):
+        groups.setdefault(r[4] if len(r) > 4 else city, []).append(i)
+
+    prices = [None] * len(rows)
+    versions = [None] * len(rows)
+    for c, idx in groups.items():
+        cm = get_city_model(c)
+        for i, v in zip(idx, predict_keys(cm, [cm.cache_key(*rows[i][:4]) for i in idx])):
+            prices[i] = v
+            versions[i] = cm.version
+    return prices, versions
+
+
+def predict_prices(rows, city=None):
+    return predict_versioned(rows, city)[0]
+
+
+def cached_price(row):
+    # cache-only lookup, None on a miss; lets the micro-batcher skip the queue
+    cm = get_city_model(row[4] if len(row) > 4 else None)
+    return cm.cache.get(cm.cache_key(*row[:4]))
+
+
+def predict_price(location, sqft, bath, bhk, city=None):
+    return predict_prices([(location, sqft, bath, bhk)], city)[0]
+
+
+def row_city(p):
+    # rows read before migrations.m007_city (or without the column selected) are Pune's
+    try:
+        return p["city"] or DEFAULT_CITY
+    except (IndexError, KeyError):
+        return DEFAULT_CITY
+
+
+def price_recommendation(listed_price, predicted_price):
+    difference = listed_price - predicted_price
+    percentage_diff = (difference / predicted_price) * 100
+    
+    if percentage_diff < -10:
+        return "Underpriced"
+    elif percentage_diff > 10:
+        return "Overpriced"
+    else:
+        return "Fairly Priced"
+
+@memoize
+def investment_score(listed_price, predicted_price):
+    listed_price = float(listed_price)
+    predicted_price = float(predicted_price)
+    if predicted_price <= 0:
+        return 50
+    diff_ratio = (predicted_price - listed_price) / predicted_price  # +ve means underpriced
+    score = 50 + (diff_ratio * 200)  # 10% underpriced => +20
+    if score < 0:
+        score = 0
+    if score > 100:
+        score = 100
+    return int(round(score))
+
+@memoize
+def deal_rating(listed_price, predicted_price):
+    listed_price = float(listed_price)
+    predicted_price = float(predicted_price)
+    if predicted_price <= 0:
+        return "Fair"
+    ratio = listed_price / predicted_price
+    if ratio <= 0.90:
+        return "Excellent"
+    if ratio <= 0.97:
+        return "Good"
+    if ratio <= 1.10:
+        return "Fair"
+    return "Overpriced"
+
+def deal_class(rating):
+    return {
+        "Excellent": "deal-excellent",
+        "Good": "deal-good",
+        "Fair": "deal-fair",
+        "Overpriced": "deal-overpriced"
+    }.get(rating, "deal-fair")
+
+def clamp(x, lo, hi):
+    return max(lo, min(hi, x))
+
+@memoize
+def risk_meter(listed_price, predicted_price, sqft, bhk, bath):
+    listed_price = float(listed_price)
+    predicted_price = float(predicted_price) if float(predicted_price) > 0 else listed_price
+    sqft = float(sqft)
+    bhk = int(bhk)
+    bath = int(bath)
+
+    ratio = listed_price / predicted_price if predicted_price > 0 else 1.0
+    risk = 0
+
+    if ratio > 1.20:
+        risk += 45
+    elif ratio > 1.10:
+        risk += 30
+    elif ratio < 0.85:
+        risk += 18
+
+    if sqft <= 0:
+        risk += 20
+    else:
+        sqft_per_bhk = sqft / max(1, bhk)
+        if sqft_per_bhk < 300:
+            risk += 20
+        elif sqft_per_bhk < 400:
+            risk += 12
+
+    if bath > bhk + 2:
+        risk += 12
+
+    return int(clamp(risk, 0, 100))
+
+def risk_label(risk):
+    if risk <= 20:
+        return ("Low", "risk-low")
+    if risk <= 50:
+        return ("Medium", "risk-med")
+    return ("High", "risk-high")
+
+@memoize
+def anomaly_flags(listed_price, predicted_price, sqft, bhk, bath):
+    listed_price = float(listed_price)
+    predicted_price = float(predicted_price) if float(predicted_price) > 0 else listed_price
+    sqft = float(sqft)
+    bhk = int(bhk)
+    bath = int(bath)
+
+    flags = []
+    ratio = listed_price / predicted_price if predicted_price > 0 else 1.0
+
+    if ratio > 1.25:
+        flags.append("Significantly above AI fair value")
+    if ratio < 0.80:
+        flags.append("Unusually below AI fair value")
+    if sqft > 0 and (sqft / max(1, bhk)) < 300:
+        flags.append("Low area per bedroom")
+    if bath > bhk + 2:
+        flags.append("Unusual bath count vs BHK")
+
+    return flags[:3]
+
+
+# ---- Column-at-a-time scorers ----
+# Same rules as the scalar functions above over whole NumPy columns, for batch scoring
+# and the catalog scan (scan.py). Each one must give exactly what its scalar twin gives:
+#   python valuation.py --check    # after touching any threshold, here or above
+
+DEAL_RATINGS = np.array(["Excellent", "Good", "Fair", "Overpriced"], dtype=object)
+RISK_LEVELS = np.array(["Low", "Medium", "High"], dtype=object)
+# anomaly_flags as bits, in the scalar function's order
+ANOMALY_FLAGS = (
+    "Significantly above AI fair value",
+    "Unusually below AI fair value",
+    "Low area per bedroom",
+    "Unusual bath count vs BHK",
+)
+
+
+def price_ratios(listed, predicted):
+    # listed / predicted, falling back to the listed price for unscored rows (risk_meter / anomaly_flags)
+    listed = np.asarray(listed, dtype=np.float64)
+    predicted = np.asarray(predicted, dtype=np.float64)
+    predicted = np.where(predicted > 0, predicted, listed)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(predicted > 0, listed / np.where(predicted > 0, predicted, 1), 1.0)
+
+
+def investment_scores(listed, predicted):
+    listed = np.asarray(listed, dtype=np.float64)
+    predicted = np.asarray(predicted, dtype=np.float64)
+    ok = predicted > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = 50 + ((predicted - listed) / np.where(ok, predicted, 1) * 200)
+    # np.round rounds half to even, like round()
+    return np.where(ok, np.round(np.clip(score, 0, 100)), 50).astype(np.int64)
+
+
+def deal_ratings(listed, predicted):
+    listed = np.asarray(listed, dtype=np.float64)
+    predicted = np.asarray(predicted, dtype=np.float64)
+    ok = predicted > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = listed / np.where(ok, predicted, 1)
+    idx = np.select([ratio <= 0.90, ratio <= 0.97, ratio <= 1.10], [0, 1, 2], 3)
+    return DEAL_RATINGS[np.where(ok, idx, 2)]
+
+
+def risk_meters(listed, predicted, sqft, bhk, bath):
+    ratio = price_ratios(listed, predicted)
+    sqft = np.asarray(sqft, dtype=np.float64)
+    bhk = np.asarray(bhk).astype(np.int64)
+    bath = np.asarray(bath).astype(np.int64)
+
+    risk = np.select([ratio > 1.20, ratio > 1.10, ratio < 0.85], [45, 30, 18], 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        per_bhk = sqft / np.maximum(1, bhk)
+    risk += np.where(sqft <= 0, 20, np.select([per_bhk < 300, per_bhk < 400], [20, 12], 0))
+    risk += np.where(bath > bhk + 2, 12, 0)
+    return np.clip(risk, 0, 100).astype(np.int64)
+
+
+def risk_levels(risk):
+    risk = np.asarray(risk)
+    return RISK_LEVELS[np.select([risk <= 20, risk <= 50], [0, 1], 2)]
+
+
+def anomaly_masks(listed, predicted, sqft, bhk, bath):
+    # bit i set <=> ANOMALY_FLAGS[i] would be in anomaly_flags(...)
+    ratio = price_ratios(listed, predicted)
+    sqft = np.asarray(sqft, dtype=np.float64)
+    bhk = np.asarray(bhk).astype(np.int64)
+    bath = np.asarray(bath).astype(np.int64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        low_area = (sqft > 0) & (sqft / np.maximum(1, bhk) < 300)
+    return ((ratio > 1.25) * 1 | (ratio < 0.80) * 2 | low_area * 4 | (bath > bhk + 2) * 8).astype(np.int64)
+
+
+def flags_from_mask(mask):
+    return [name for i, name in enumerate(ANOMALY_FLAGS) if int(mask) >> i & 1][:3]
+
+
+def valuate(listings, preds=None):
+    # [(location, sqft, bath, bhk, listed_price, city), ...] -> full valuation dicts, one model call
+    if preds is None:
+        preds = predict_prices([l[:4] + l[5:] for l in listings])
+    out = []
+    if not listings:
+        return out
+    with timer("score"):
+        _, sqft, bath, bhk, listed, _ = (list(c) for c in zip(*listings))
+        ratings = deal_ratings(listed, preds).tolist()
+        scores = investment_scores(listed, preds).tolist()
+        risks = risk_meters(listed, preds, sqft, bhk, bath)
+        levels = risk_levels(risks).tolist()
+        masks = anomaly_masks(listed, preds, sqft, bhk, bath).tolist()
+        for i, ((location, sqft, bath, bhk, listed_price, city), pred) in enumerate(zip(listings, preds)):
+            out.append({
+                "city": city,
+                "location": location,
+                "sqft": sqft,
+                "bath": bath,
+                "bhk": bhk,
+                "listed_price": listed_price,
+                "predicted_price": round(pred, 2),
+                "fair_low": round(pred * 0.92, 2),
+                "fair_high": round(pred * 1.08, 2),
+                "recommendation": price_recommendation(listed_price, pred),
+                "deal_rating": ratings[i],
+                "investment_score": scores[i],
+                "risk_score": int(risks[i]),
+                "risk_level": levels[i],
+                "anomaly_flags": flags_from_mask(masks[i]),
+            })
+    return out
+
+
+# ---- Listing records ----
+# properties rows as compact __slots__ objects instead of sqlite3.Row -> dict copies.
+# Built straight from the cursor by listing_row; p["field"] still works for older helpers
+# and for the templates.
+
+LISTING_FIELDS = (
+    "id", "location", "sqft", "bath", "bhk", "listed_price", "image", "city",
+    "predicted_price", "deal_rating", "investment_score", "risk_score", "model_version",
+)
+_LISTING_FIELD_SET = frozenset(LISTING_FIELDS)
+
+
+class Listing:
+    # loc_id is only valid for the model version in loc_version (see listing_key)
+    __slots__ = LISTING_FIELDS + ("loc_id", "loc_version")
+
+    def __init__(self):
+        for name in LISTING_FIELDS:
+            setattr(self, name, None)
+        self.loc_id = -1
+        self.loc_version = None
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    # display values for the listing cards
+    @property
+    def recommendation(self):
+        return price_recommendation(self.listed_price, self.predicted_price)
+
+    @property
+    def deal_class(self):
+        return deal_class(self.deal_rating)
+
+    @property
+    def fair_low(self):
+        return round(self.predicted_price * 0.92, 2)
+
+    @property
+    def fair_high(self):
+        return round(self.predicted_price * 1.08, 2)
+
+
+def listing_row(cursor, row):
+    # sqlite3 row_factory: cursor.row_factory = listing_row
+    p = Listing()
+    for (name, *_), value in zip(cursor.description, row):
+        if name in _LISTING_FIELD_SET:
+            setattr(p, name, value)
+    cm = get_city_model(p.city)
+    p.loc_id = cm.location_ids.get(p.location, -1)
+    p.loc_version = cm.version
+    return p
+
+
+def listing_key(cm, p):
+    # encoded model input; Listing records already carry their location id
+    if isinstance(p, Listing) and p.loc_version == cm.version:
+        return (p.loc_id, float(p.sqft), int(p.bath), int(p.bhk))
+    return cm.cache_key(p["location"], p["sqft"], p["bath"], p["bhk"])
+
+
+# ---- Persisted valuations ----
+# properties carries the model output + derived scores so read paths don't re-run inference
+# (columns added by migrations.m002_valuation_columns)
+
+
+def score_listing(listed_price, predicted_price, sqft, bath, bhk):
+    # -> (predicted_price, deal_rating, investment_score, risk_score)
+    return (
+        float(predicted_price),
+        deal_rating(listed_price, predicted_price),
+        investment_score(listed_price, predicted_price),
+        risk_meter(listed_price, predicted_price, sqft, bhk, bath),
+    )
+
+
+def is_current(p):
+    # scored by the current model of the listing's city
+    return p["model_version"] == model_version(row_city(p)) and p["predicted_price"] is not None
+
+
+def stale_clause():
+    # SQL condition for rows not scored by their city's current model -> (sql, params)
+    models = active_models()
+    whens = " ".join("WHEN ? THEN ?" for _ in models)
+    params = [x for city, m in models.items() for x in (city, m.version)] + [models[DEFAULT_CITY].version]
+    return f"(model_version IS NULL OR model_version != CASE city {whens} ELSE ? END)", params
+
+
+def score_rows(rows):
+    # rows with location, sqft, bath, bhk, listed_price, city
+    # -> [(predicted_price, deal_rating, investment_score, risk_score, model_version), ...]
+    groups = {}
+    for i, p in enumerate(rows):
+        groups.setdefault(row_city(p), []).append(i)
+
+    out = [None] * len(rows)
+    for city, idx in groups.items():
+        cm = get_city_model(city)
+        preds = np.asarray(predict_keys(cm, [listing_key(cm, rows[i]) for i in idx]), dtype=np.float64)
+        with timer("score"):
+            listed = [rows[i]["listed_price"] for i in idx]
+            sqft = [rows[i]["sqft"] for i in idx]
+            bath = [rows[i]["bath"] for i in idx]
+            bhk = [rows[i]["bhk"] for i in idx]
+            scored = zip(
+                preds.tolist(),
+                deal_ratings(listed, preds).tolist(),
+                investment_scores(listed, preds).tolist(),
+                risk_meters(listed, preds, sqft, bhk, bath).tolist(),
+            )
+            for i, s in zip(idx, scored):
+                out[i] = s + (cm.version,)
+    return out
+
+
+def store_valuations(conn, updates):
+    # updates: [(predicted_price, deal_rating, investment_score, risk_score, model_version, id), ...]
+    conn.executemany("""
+        UPDATE properties
+        SET predicted_price = ?, deal_rating = ?, investment_score = ?, risk_score = ?, model_version = ?
+        WHERE id = ?
+    """, updates)
+
+
+def cached_valuations(conn, rows):
+    # Stored values for current rows; stale rows are scored in one batch and written back
+    out = [None] * len(rows)
+    stale = []
+    for i, p in enumerate(rows):
+        if is_current(p):
+            out[i] = (p["predicted_price"], p["deal_rating"], p["investment_score"], p["risk_score"])
+        else:
+            stale.append(i)
+
+    if stale:
+        scored = score_rows([rows[i] for i in stale])
+        for i, s in zip(stale, scored):
+            out[i] = s[:4]
+        store_valuations(conn, [s + (rows[i]["id"],) for i, s in zip(stale, scored)])
+        conn.commit()
+
+    return out
+
+
+def claim_rescore(conn):
+    # True for the one process (of however many saw this model swap) that should rescore.
+    # BEGIN IMMEDIATE takes the write lock before reading, so two workers can't both move the row.
+    versions = ",".join(f"{c}={v}" for c, v in sorted(model_versions().items()))
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cur = conn.execute(
+            "UPDATE model_swap SET versions = ?, pid = ?, claimed_at = ? WHERE id = 1 AND versions IS NOT ?",
+            (versions, os.getpid(), int(time.time()), versions),
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return cur.rowcount == 1
+
+
+def refresh_valuations(conn, batch_size=5000, cities=None):
+    # Rescore every row whose stored valuation came from another model version;
+    # cities limits it to those cities' rows (the default city's model also scores
+    # cities without their own, so a change there means everything)
+    conn.row_factory = sqlite3.Row
+    total = 0
+    last_id = 0
+    stale, stale_params = stale_clause()
+    if cities and DEFAULT_CITY not in cities:
+        cities = sorted(cities)
+        stale += f" AND city IN ({', '.join('?' for _ in cities)})"
+        stale_params = stale_params + cities
+    while True:
+        rows = conn.execute(f"""
+            SELECT id, location, sqft, bath, bhk, listed_price, city FROM properties
+            WHERE id > ? AND {stale}
+            ORDER BY id LIMIT ?
+        """, [last_id] + stale_params + [batch_size]).fetchall()
+        if not rows:
+            break
+        store_valuations(conn, [s + (p["id"],) for p, s in zip(rows, score_rows(rows))])
+        conn.commit()
+        total += len(rows)
+        last_id = rows[-1]["id"]
+    return total
+
+
+def check_scorers(n=100000, seed=0):
+    # Vector scorers vs their scalar twins on random listings plus every rule boundary
+    # -> list of (name, row index) mismatches; empty means they agree exactly
+    rnd = np.random.default_rng(seed)
+    predicted = np.round(rnd.uniform(-20, 400, n), 2)
+    listed = np.round(predicted * rnd.uniform(0.5, 1.6, n), 2)
+    sqft = rnd.integers(-100, 4000, n).astype(np.float64)
+    bhk = rnd.integers(0, 7, n)
+    bath = rnd.integers(0, 10, n)
+
+    # exact ratio boundaries and one ulp either side, investment-score rounding halves,
+    # sqft-per-bhk thresholds, bath = bhk + 2, unscored (predicted <= 0) and sqft <= 0
+    edges = []
+    for r in (0.80, 0.85, 0.90, 0.97, 1.10, 1.20, 1.25):
+        at = round(r * 100, 6)  # at / 100 == r exactly
+        for listed_price in (at, np.nextafter(at, 0), np.nextafter(at, 1000)):
+            edges.append((listed_price, 100.0, 1000.0, 2, 2))
+    for half in (50.5, 51.5, 0.5, 99.5):
+        edges.append((100 - (half - 50) / 2, 100.0, 1000.0, 2, 2))
+    for per_bhk in (299.99, 300, 300.01, 399.99, 400, 400.01):
+        edges.append((100.0, 100.0, per_bhk * 3, 3, 2))
+    edges += [(100.0, 100.0, 1000.0, 2, b) for b in (3, 4, 5)]
+    edges += [(l, p, s, 2, 2) for l in (0.0, 50.0) for p in (0.0, -5.0, 100.0) for s in (0.0, -10.0, 1000.0)]
+    edges += [(100.0, 100.0, 500.0, 0, 3)]
+    e = np.array(edges, dtype=np.float64)
+    listed, predicted, sqft = np.r_[listed, e[:, 0]], np.r_[predicted, e[:, 1]], np.r_[sqft, e[:, 2]]
+    bhk, bath = np.r_[bhk, e[:, 3].astype(np.int64)], np.r_[bath, e[:, 4].astype(np.int64)]
+
+    scores = investment_scores(listed, predicted)
+    ratings = deal_ratings(listed, predicted)
+    risks = risk_meters(listed, predicted, sqft, bhk, bath)
+    levels = risk_levels(risks)
+    masks = anomaly_masks(listed, predicted, sqft, bhk, bath)
+
+    # __wrapped__: the plain functions, so the check doesn't fill the memo caches
+    bad = []
+    for i, row in enumerate(zip(listed.tolist(), predicted.tolist(), sqft.tolist(), bhk.tolist(), bath.tolist())):
+        l, p = row[:2]
+        risk = risk_meter.__wrapped__(*row)
+        for name, got, want in (
+            ("investment_scores", scores[i], investment_score.__wrapped__(l, p)),
+            ("deal_ratings", ratings[i], deal_rating.__wrapped__(l, p)),
+            ("risk_meters", risks[i], risk),
+            ("risk_levels", levels[i], risk_label(risk)[0]),
+            ("anomaly_masks", flags_from_mask(masks[i]), anomaly_flags.__wrapped__(*row)),
+        ):
+            if got != want:
+                bad.append((name, i))
+    return bad
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rescore stored valuations with the deployed models")
+    parser.add_argument("--check", action="store_true",
+                        help="only verify the vector scorers against the scalar rules, then exit")
+    parser.add_argument("--samples", type=int, default=100000, help="random listings for --check")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        bad = check_scorers(args.samples)
+        for name, i in bad[:20]:
+            print(f"  {name} disagrees with its scalar twin on row {i}", file=sys.stderr)
+        if bad:
+            print(f"❌ {len(bad)} mismatches between vector and scalar scorers", file=sys.stderr)
+            sys.exit(1)
+        print(f"✅ Vector scorers match the scalar rules on {args.samples} listings + boundaries")
+        return
+
+    # After deploying a new model (or editing model/registry.json): python valuation.py
+    from migrations import DB_PATH, migrate
+
+    conn = sqlite3.connect(DB_PATH)
+    migrate(conn)
+    n = refresh_valuations(conn)
+    conn.close()
+    versions = ", ".join(f"{c} {v}" for c, v in sorted(model_versions().items()))
+    print(f"✅ Refreshed {n} valuations (models: {versions})")
+
+
+if __name__ == "__main__":
+    main()